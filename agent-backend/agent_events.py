@@ -0,0 +1,303 @@
+import asyncio
+import json
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+from google.genai import types
+
+from agent_turn import AgentTurn, best_effort_answer
+from context_builder import estimate_tokens, record_prompt, render_history
+from conversation_store import ConversationStore
+from llm_config import LLM_TIMEOUT, stream_llm_response, tool_config
+from prompt_templates import PromptTemplate
+from tools import cancel_prefetch, describe_tool_results, handle_tool_usage, parse_tool_calls, start_prefetch, tool_declarations
+
+# Prefixes after which the agents' replies are meant for the user
+USER_VISIBLE_MARKERS = ("ANSWER:::", "REQUEST_INFORMATION:::")
+TOOL_MARKERS = ("USE_TOOL:::", "USE_TOOLS:::")
+_REPLY_PATTERN = re.compile(r"(?:ANSWER|REQUEST_INFORMATION):::\s*(.*)", re.DOTALL)
+
+# Declares the tools to Gemini for native function calling; built once
+TOOL_CONFIG = tool_config(tool_declarations)
+
+
+def event(name: str, **data) -> Dict[str, Any]:
+    """
+    One step of an agent turn. Names: `tool_started`, `tool_finished`, `token` (a piece of the
+    answer as Gemini streams it), `answer` (the final answer, always last) and, internally,
+    `llm_done` (the full text of one LLM reply).
+    """
+    return {"event": name, "data": data}
+
+
+def is_tool_call(text: str) -> bool:
+    return any(marker in text for marker in TOOL_MARKERS)
+
+
+def reply_of(text: str) -> Optional[str]:
+    """What follows ANSWER::: or REQUEST_INFORMATION:::, or None if the reply has neither."""
+    match = _REPLY_PATTERN.search(text)
+    return match.group(1).strip() if match else None
+
+
+def pending_tool_calls(reply: Dict[str, Any]) -> Union[List[tuple], str, None]:
+    """
+    Tool calls of an `llm_done` reply for handle_tool_usage: its function calls, else its
+    text if it uses the USE_TOOL::: fallback format, else None.
+    """
+    if reply["tool_calls"]:
+        return reply["tool_calls"]
+    if is_tool_call(reply["text"]):
+        return reply["text"]
+    return None
+
+
+def partial_text(text: str) -> str:
+    """The part of a reply worth showing when the turn stops early: no tool call, no format marker."""
+    for marker in TOOL_MARKERS:
+        text = text.split(marker)[0]
+    answer = reply_of(text)
+    return (text if answer is None else answer).strip()
+
+
+def describe_reply(reply: Dict[str, Any]) -> str:
+    """Reply text plus its function calls, for the history and the follow-up prompt."""
+    if not reply["tool_calls"]:
+        return reply["text"]
+    calls = [{"tool_name": name, "parameters": params} for name, params in reply["tool_calls"]]
+    return f"{reply['text']} Called tools: {json.dumps(calls)}".strip()
+
+
+def tool_name_of(calls: Union[List[tuple], str]) -> str:
+    try:
+        if isinstance(calls, str):
+            calls = parse_tool_calls(calls)
+        return ", ".join(tool_name for tool_name, _ in calls)
+    except Exception:
+        return "unknown"
+
+
+def speculative_tool_calls(current_date: datetime) -> List[tuple]:
+    """Read-only calls nearly every turn needs: the goals and a spending snapshot of the last three full months."""
+    end = current_date.replace(day=1) - timedelta(days=1)
+    start = end
+    for _ in range(2):
+        start = start.replace(day=1) - timedelta(days=1)
+    return [
+        ("get_goals", {}),
+        ("get_spending_snapshot", {
+            "start_date": start.replace(day=1).strftime("%Y-%m-%d"),
+            "end_date": end.strftime("%Y-%m-%d"),
+        }),
+    ]
+
+
+def _visible_start(text: str, plain_answer: bool):
+    for marker in USER_VISIBLE_MARKERS:
+        index = text.find(marker)
+        if index >= 0:
+            return index + len(marker)
+    return 0 if plain_answer else None
+
+
+async def stream_reply(
+    prompt: str,
+    agent: str,
+    plain_answer: bool = False,
+    turn: Optional[AgentTurn] = None,
+    config: Optional[types.GenerateContentConfig] = None,
+):
+    """
+    Stream one LLM reply, with the tools declared for function calling (by `config`, e.g.
+    from PromptTemplate.config, else TOOL_CONFIG). Yields `token` events
+    for the part the user will see and then an `llm_done` event with the full text and the
+    (tool_name, parameters) function calls. With plain_answer the whole reply is user-facing,
+    otherwise only what follows ANSWER::: or REQUEST_INFORMATION:::. With a turn, the call is
+    cut to the turn's remaining time and its latency and tokens are recorded on it.
+    Tokens are provisional: a reply that ends up as a tool call is followed by `tool_started`
+    instead of `answer`, and the final `answer` event always carries the complete content.
+    """
+    text = ""
+    sent = 0
+    tool_calls = []
+    usage: Dict[str, int] = {}
+    started = time.perf_counter()
+    timeout = turn.llm_timeout() if turn else LLM_TIMEOUT
+    async for chunk in stream_llm_response(prompt, agent=agent, timeout=timeout, config=config or TOOL_CONFIG, usage=usage):
+        if not isinstance(chunk, str):
+            tool_calls.append((chunk.name, dict(chunk.args or {})))
+            continue
+        text += chunk
+        if tool_calls or is_tool_call(text):
+            continue
+        start = _visible_start(text, plain_answer)
+        if start is None:
+            continue
+        # Hold back a tail that could be the beginning of a tool marker
+        safe_end = len(text) - max(len(marker) for marker in TOOL_MARKERS) + 1
+        sent = max(sent, start)
+        if safe_end > sent:
+            yield event("token", text=text[sent:safe_end])
+            sent = safe_end
+    if turn:
+        # Estimate when Gemini did not report usage
+        usage.setdefault("prompt_tokens", estimate_tokens(prompt))
+        usage.setdefault("output_tokens", estimate_tokens(text))
+        turn.record_llm(time.perf_counter() - started, usage)
+    yield event("llm_done", text=text, tool_calls=tool_calls)
+
+
+async def run_agent_turn(
+    agent: str,
+    prompt_template: PromptTemplate,
+    tool_used_template: PromptTemplate,
+    input: str,
+    session_id: str,
+    conversations: ConversationStore,
+    welcome_message: Dict[str, str],
+    current_date: datetime,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run one turn of an agent, yielding progress events and finally an `answer` event. The
+    first reply is asked with prompt_template; after each round of tools the agent continues
+    with tool_used_template until it answers or the turn hits one of its limits.
+    """
+    message_history = conversations.load(session_id)
+    prefetched = None
+    turn = None
+    outcome = "answered"
+    # What a turn cut short can still answer with: the latest model text and tool results
+    partial = ""
+    tool_results: List[tuple] = []
+    try:
+        # Starting the conversation.
+        if input.strip().lower() == "/start":
+            message_history.clear()
+            message_history.append(welcome_message)
+            yield event("answer", content=welcome_message["content"])
+            return
+
+        message_history.append({
+            "role": "user",
+            "content": input
+        })
+
+        prompt = prompt_template.render(
+            input=input,
+            current_date=current_date.strftime('%Y-%m-%d'),
+            history=render_history(message_history),
+        )
+
+        turn = AgentTurn(agent)
+        config = await prompt_template.config()
+        record_prompt(agent, prompt)
+
+        # Fetch the data the agent nearly always asks for while the LLM is thinking
+        prefetched = start_prefetch(speculative_tool_calls(current_date))
+
+        async for item in stream_reply(prompt, agent=agent, turn=turn, config=config):
+            if item["event"] == "llm_done":
+                reply = item["data"]
+            else:
+                if item["event"] == "token":
+                    partial += item["data"]["text"]
+                yield item
+        partial = partial_text(reply["text"])
+        agent_response = describe_reply(reply)
+        tool_calls = pending_tool_calls(reply)
+
+        message_history.append({
+            "role": "system",
+            "content": agent_response
+        })
+
+        # Handle REQUEST_INFORMATION or ANSWER directly
+        answer = reply_of(agent_response)
+        if answer is not None and not reply["tool_calls"]:
+            yield event("answer", content=answer)
+            return
+
+        # Run the tools the agent called
+        while tool_calls:
+            limit = turn.limit_reached(next_step=True)
+            if limit:
+                outcome = limit
+                yield event("answer", content=best_effort_answer(limit, partial, describe_tool_results(tool_results)))
+                return
+
+            tool_name = tool_name_of(tool_calls)
+            yield event("tool_started", tool=tool_name)
+            tool_started_at = time.perf_counter()
+            # Tools are not cut off by the deadline: a write stopped halfway would not be rolled back
+            tool_results = []
+            tool_response = await handle_tool_usage(tool_calls, prefetched, tool_results)
+            turn.record_tools(tool_name, time.perf_counter() - tool_started_at)
+            yield event("tool_finished", tool=tool_name, duration_ms=round(1000 * (time.perf_counter() - tool_started_at)))
+            message_history.append({
+                "role": "system",
+                "content": tool_response
+            })
+
+            tool_used_prompt = tool_used_template.render(
+                current_date=current_date.strftime('%Y-%m-%d'),
+                input=input,
+                agent_response=agent_response,
+                tool_response=tool_response,
+                history=render_history(message_history),
+            )
+
+            limit = turn.limit_reached(record_prompt(agent, tool_used_prompt) + tool_used_template.instruction_tokens)
+            if limit:
+                outcome = limit
+                yield event("answer", content=best_effort_answer(limit, partial, describe_tool_results(tool_results)))
+                return
+
+            partial = ""
+            async for item in stream_reply(tool_used_prompt, agent=agent, plain_answer=True, turn=turn, config=await tool_used_template.config()):
+                if item["event"] == "llm_done":
+                    reply = item["data"]
+                else:
+                    if item["event"] == "token":
+                        partial += item["data"]["text"]
+                    yield item
+            partial = partial_text(reply["text"])
+            tool_used_explanation = describe_reply(reply)
+            tool_calls = pending_tool_calls(reply)
+
+            message_history.append({
+                "role": "system",
+                "content": tool_used_explanation
+            })
+
+            if tool_calls:
+                # If the agent called another tool, we need to run it too
+                agent_response = tool_used_explanation
+                continue
+            # Otherwise this is the final answer
+            yield event("answer", content=tool_used_explanation)
+            return
+
+        # If the response was not in the expected format, just return the agent's response
+        yield event("answer", content=agent_response)
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        if turn and turn.remaining() <= 0:
+            # The LLM call was cut off by the turn deadline
+            outcome = "deadline"
+            yield event("answer", content=best_effort_answer("deadline", partial.strip(), describe_tool_results(tool_results)))
+        else:
+            outcome = "error"
+            yield event("answer", content=f"An error occurred: {str(e)}")
+    finally:
+        cancel_prefetch(prefetched)
+        if turn:
+            turn.finish(outcome)
+        conversations.save(session_id, message_history)
+
+
+def format_sse(item: Dict[str, Any]) -> str:
+    return f"event: {item['event']}\ndata: {json.dumps(item['data'])}\n\n"
@@ -0,0 +1,153 @@
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from llm_config import LLM_TIMEOUT
+from telemetry import AGENT_TURNS
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Config
+# Tool rounds one agent turn may run before it has to answer.
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "5"))
+# Seconds one agent turn may take, LLM calls and tools included.
+AGENT_TURN_DEADLINE = float(os.getenv("AGENT_TURN_DEADLINE", "90"))
+# Prompt plus output tokens one agent turn may spend.
+AGENT_TURN_TOKEN_BUDGET = int(os.getenv("AGENT_TURN_TOKEN_BUDGET", "60000"))
+# Finished turns kept in memory for get_turn_stats.
+AGENT_RECENT_TURNS = int(os.getenv("AGENT_RECENT_TURNS", "100"))
+
+# Why a turn was cut short, as said to the user
+_LIMIT_REASONS = {
+    "steps": "it needed more tool calls than one request allows",
+    "deadline": "it was taking too long",
+    "tokens": "it needed more processing than one request allows",
+}
+
+_totals: Dict[str, Dict[str, Any]] = {}
+_recent: Deque[Dict[str, Any]] = deque(maxlen=AGENT_RECENT_TURNS)
+
+
+class AgentTurn:
+    """Limits and cost accounting for one agent turn: tool rounds, wall-clock time and tokens."""
+
+    def __init__(
+        self,
+        agent: str,
+        max_steps: int = AGENT_MAX_STEPS,
+        deadline: float = AGENT_TURN_DEADLINE,
+        token_budget: int = AGENT_TURN_TOKEN_BUDGET,
+    ):
+        self.agent = agent
+        self.max_steps = max_steps
+        self.token_budget = token_budget
+        self.started = time.perf_counter()
+        self.deadline = self.started + deadline
+        self.steps = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.perf_counter())
+
+    def llm_timeout(self) -> float:
+        """Timeout for the next LLM call: the usual one, cut to what is left of the turn."""
+        return min(LLM_TIMEOUT, self.remaining())
+
+    def limit_reached(self, next_prompt_tokens: int = 0, next_step: bool = False) -> Optional[str]:
+        """
+        "steps", "deadline" or "tokens" if the turn may not continue, else None.
+        next_prompt_tokens is the estimated size of the prompt about to be sent; next_step
+        asks whether another round of tools may run.
+        """
+        if next_step and self.steps >= self.max_steps:
+            return "steps"
+        if self.remaining() <= 0:
+            return "deadline"
+        if self.tokens + next_prompt_tokens > self.token_budget:
+            return "tokens"
+        return None
+
+    def record_llm(self, seconds: float, usage: Dict[str, int]):
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.output_tokens += usage.get("output_tokens", 0)
+        self.llm_calls.append({"latency_s": round(seconds, 3), **usage})
+
+    def record_tools(self, tool_name: str, seconds: float):
+        self.steps += 1
+        self.tool_calls.append({"tool": tool_name, "latency_s": round(seconds, 3)})
+
+    def finish(self, outcome: str) -> Dict[str, Any]:
+        """Add the turn to the statistics. outcome is "answered", "error" or the limit reached."""
+        stats = {
+            "agent": self.agent,
+            "outcome": outcome,
+            "duration_s": round(time.perf_counter() - self.started, 3),
+            "steps": self.steps,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "llm_calls": self.llm_calls,
+            "tool_calls": self.tool_calls,
+        }
+        _recent.append(stats)
+        AGENT_TURNS.labels(agent=self.agent, outcome=outcome).inc()
+
+        totals = _totals.setdefault(self.agent, {
+            "turns": 0,
+            "steps": 0,
+            "llm_calls": 0,
+            "tool_calls": 0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "total_duration_s": 0.0,
+            "total_llm_latency_s": 0.0,
+            "total_tool_latency_s": 0.0,
+            "outcomes": {},
+        })
+        totals["turns"] += 1
+        totals["steps"] += self.steps
+        totals["llm_calls"] += len(self.llm_calls)
+        totals["tool_calls"] += len(self.tool_calls)
+        totals["prompt_tokens"] += self.prompt_tokens
+        totals["output_tokens"] += self.output_tokens
+        totals["total_duration_s"] += stats["duration_s"]
+        totals["total_llm_latency_s"] += sum(call["latency_s"] for call in self.llm_calls)
+        totals["total_tool_latency_s"] += sum(call["latency_s"] for call in self.tool_calls)
+        totals["outcomes"][outcome] = totals["outcomes"].get(outcome, 0) + 1
+        return stats
+
+
+def best_effort_answer(reason: str, partial_text: str = "", tool_results: str = "") -> str:
+    """
+    What the user gets when a turn hits one of its limits before the agent answered: the
+    model's text so far and a digest of the last tool results, with a note on why it stopped.
+    """
+    parts = []
+    if partial_text:
+        parts.append(partial_text)
+    if tool_results:
+        parts.append(f"This is what I found so far:\n{tool_results}")
+    parts.append(
+        f"I had to stop working on this because {_LIMIT_REASONS[reason]}"
+        + (", so this answer may be incomplete. " if parts else ". ")
+        + "Could you ask about a smaller part of it, or tell me what matters most?"
+    )
+    return "\n\n".join(parts)
+
+
+def get_turn_stats() -> Dict[str, Any]:
+    """Totals per agent since the process started, and the most recent turns in detail."""
+    return {
+        "totals": {agent: {**totals, "outcomes": dict(totals["outcomes"])} for agent, totals in _totals.items()},
+        "recent": list(_recent),
+    }
@@ -0,0 +1,450 @@
+"""
+Load test of the agent and summary routes, run in-process: the real FastAPI app and
+routes.py, a scripted fake Gemini client and an in-process stand-in for the JSON server
+seeded from db.json. Measures throughput and p50/p95/p99 latency per scenario, dataset
+size and concurrency, and writes the results as JSON so runs can be compared across commits.
+
+    python benchmarks/bench_agents.py [--scenarios goal budget summary] [--sizes 1000 100000]
+        [--concurrency 1 8 32] [--requests 200] [--llm-latency 0.2] [--output results.json]
+    python benchmarks/bench_agents.py --datasets history-100k.ndjson history-1m.ndjson
+    python benchmarks/bench_agents.py --compare old.json new.json
+
+The fake model answers every first prompt with a tool call (USE_TOOL::: text, or a native
+function call with --function-calls) and every follow-up with ANSWER:::, so each agent turn
+runs one tool round and two LLM calls. The summary model echoes the JSON it was given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+from uuid import uuid4
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DB_JSON = os.path.join(BACKEND_DIR, "..", "json-server", "db.json")
+
+SCENARIOS = ("goal", "budget", "summary")
+SUMMARY_MONTHS = [f"2024-{m:02d}" for m in range(2, 13)]
+
+# First reply of each agent: the tool it calls, with its parameters
+AGENT_TOOL_CALLS = {
+    "goal": ("get_goals", {}),
+    "budget": ("get_spending_snapshot", {"start_date": "2024-02-01", "end_date": "2024-04-30"}),
+}
+AGENT_PROMPTS = {
+    "goal": "I want to save 3000 for a new bike by next summer.",
+    "budget": "Help me set a budget for next month based on my spending.",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000],
+                        help="transactions in the data store; 1000 is the seeded db.json")
+    parser.add_argument("--datasets", nargs="+", metavar="PATH",
+                        help="run on files from generate_transactions.py (.json, .ndjson, .db) instead of --sizes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per run")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests before each run")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="mean seconds per fake LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.25, help="relative spread of the LLM latency")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="seconds per JSON server request")
+    parser.add_argument("--storage", choices=("json-server", "sqlite"), default="json-server")
+    parser.add_argument("--function-calls", action="store_true", help="reply with native function calls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="compare two result files instead of running")
+    return parser.parse_args()
+
+
+# The app reads its config at import time, so point it at the stand-ins first
+def configure_environment(args, workdir: str):
+    os.environ["GEMINI_API_KEY"] = os.environ.get("GEMINI_API_KEY", "benchmark")
+    os.environ["JSON_SERVER_URL"] = "http://json-server.benchmark"
+    os.environ["STORAGE_BACKEND"] = args.storage
+    os.environ["STORAGE_DB_PATH"] = os.path.join(workdir, "budgy.db")
+    os.environ["CONVERSATION_STORE"] = "memory"
+    os.environ["SUMMARY_CACHE"] = "memory"
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def scaled_transactions(seed_rows: List[Dict], n: int, seed: int) -> List[Dict]:
+    """n transactions over the seeded year: the seed rows repeated with jittered amounts."""
+    if n <= len(seed_rows):
+        return seed_rows[:n]
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        row = dict(seed_rows[i % len(seed_rows)])
+        if i >= len(seed_rows):
+            row["Amount"] = round(float(row["Amount"]) * rng.uniform(0.5, 1.5), 2)
+            row["id"] = f"bench{i:x}"
+        rows.append(row)
+    return rows
+
+
+class FakeJsonServer:
+    """json-server semantics (filters, pages, POST/PUT/DELETE by id) over a dict, as an httpx transport."""
+
+    def __init__(self, db: Dict[str, List[Dict]], latency: float = 0.0):
+        self.db = db
+        self.latency = latency
+
+    async def handle(self, request):
+        import httpx
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parts = request.url.path.strip("/").split("/")
+        collection, row_id = parts[0], parts[1] if len(parts) > 1 else None
+        rows = self.db.setdefault(collection, [])
+
+        if request.method == "GET" and row_id is None:
+            return httpx.Response(200, json=self._query(rows, dict(parse_qsl(request.url.query.decode()))))
+        if request.method == "POST":
+            row = json.loads(request.content)
+            row.setdefault("id", uuid4().hex[:4])
+            rows.append(row)
+            return httpx.Response(201, json=row)
+
+        index = next((i for i, r in enumerate(rows) if str(r.get("id")) == row_id), None)
+        if index is None:
+            return httpx.Response(404, json={})
+        if request.method == "GET":
+            return httpx.Response(200, json=rows[index])
+        if request.method == "PUT":
+            rows[index] = {**json.loads(request.content), "id": row_id}
+            return httpx.Response(200, json=rows[index])
+        if request.method == "DELETE":
+            return httpx.Response(200, json=rows.pop(index))
+        return httpx.Response(405, json={})
+
+    @staticmethod
+    def _query(rows: List[Dict], params: Dict[str, str]):
+        """Equality and _gte/_lte filters, _sort, and _page/_per_page pages like json-server 1.0.0-beta.3."""
+        page, per_page, sort = params.pop("_page", None), int(params.pop("_per_page", 10)), params.pop("_sort", None)
+        # Like the real server, range conditions only match numbers (and parse the bound as an int)
+        tests = {
+            "_gte": lambda value, bound: isinstance(value, (int, float)) and value >= int(bound),
+            "_lte": lambda value, bound: isinstance(value, (int, float)) and value <= int(bound),
+        }
+        matched = []
+        for row in rows:
+            for key, bound in params.items():
+                test = next((t for suffix, t in tests.items() if key.endswith(suffix)), None)
+                field = key[:-4] if test else key
+                if not (test(row.get(field), bound) if test else str(row.get(field)) == bound):
+                    break
+            else:
+                matched.append(row)
+        if sort:
+            matched.sort(key=lambda r: r.get(sort))
+        if page is None:
+            return matched
+        page, pages = int(page), max(1, -(-len(matched) // per_page))
+        return {
+            "first": 1,
+            "prev": page - 1 if page > 1 else None,
+            "next": page + 1 if page < pages else None,
+            "last": pages,
+            "pages": pages,
+            "items": len(matched),
+            "data": matched[(page - 1) * per_page : page * per_page],
+        }
+
+
+class _FakeCaches:
+    """client.aio.caches: remembers the system instruction of every cache it creates."""
+
+    def __init__(self):
+        self.instructions: Dict[str, str] = {}
+
+    async def create(self, model: str, config):
+        from google.genai import types
+
+        name = f"cachedContents/{uuid4().hex[:12]}"
+        self.instructions[name] = config.system_instruction
+        return types.CachedContent(name=name, model=model)
+
+    async def delete(self, name: str):
+        self.instructions.pop(name, None)
+
+
+class FakeGemini:
+    """
+    Stands in for genai.Client: client.aio.models.generate_content(_stream) with scripted
+    replies and a seeded random latency, client.aio.caches for context caching, and usage
+    metadata estimated from the text length.
+    """
+
+    def __init__(self, latency: float, jitter: float, function_calls: bool, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.function_calls = function_calls
+        self.rng = random.Random(seed)
+        self.aio = self
+        self.models = self
+        self.caches = _FakeCaches()
+        self.calls = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def _prompt(self, contents: str, config) -> Tuple[str, int]:
+        """The full prompt the model would see, and how many of its tokens came from a cache."""
+        if config is not None and config.cached_content:
+            instructions = self.caches.instructions[config.cached_content]
+            return instructions + "\n" + contents, len(instructions) // 4
+        if config is not None and config.system_instruction:
+            return config.system_instruction + "\n" + contents, 0
+        return contents, 0
+
+    def _response(self, prompt: str, parts, cached: int = 0):
+        from google.genai import types
+
+        output = sum(len(p.text or "") for p in parts) // 4 + 1
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=len(prompt) // 4, cached_content_token_count=cached, candidates_token_count=output
+            ),
+        )
+
+    def _reply_parts(self, prompt: str):
+        from google.genai import types
+
+        if "Monthly-Summary Agent" in prompt:
+            # The month's data is the last fenced block of the prompt
+            data = prompt.rsplit("```json", 1)[1].split("```", 1)[0].strip()
+            return [types.Part(text=f"Solid month overall.\n```json\n{data}\n```")]
+        if "Here is the tool response" in prompt:
+            return [types.Part(text="ANSWER:::Based on what I found, this looks realistic. Let's go for it.")]
+        agent = "goal" if "realistic financial goal" in prompt else "budget"
+        name, params = AGENT_TOOL_CALLS[agent]
+        if self.function_calls:
+            return [types.Part(text="Let me look that up. "), types.Part(function_call=types.FunctionCall(name=name, args=params))]
+        return [types.Part(text=f"Let me look that up. USE_TOOL:::{name}:::{json.dumps(params)}")]
+
+    async def generate_content(self, model: str, contents: str, config=None):
+        self.calls += 1
+        prompt, cached = self._prompt(contents, config)
+        await asyncio.sleep(self._delay())
+        return self._response(prompt, self._reply_parts(prompt), cached)
+
+    async def generate_content_stream(self, model: str, contents: str, config=None):
+        from google.genai import types
+
+        self.calls += 1
+        prompt, cached = self._prompt(contents, config)
+        parts = self._reply_parts(prompt)
+        delay = self._delay()
+        # Text arrives in ~40 character chunks, half the latency before the first one
+        pieces = []
+        for part in parts:
+            if part.text:
+                pieces += [types.Part(text=part.text[i:i + 40]) for i in range(0, len(part.text), 40)]
+            else:
+                pieces.append(part)
+
+        async def stream():
+            await asyncio.sleep(delay / 2)
+            for piece in pieces:
+                last = piece is pieces[-1]
+                yield self._response(prompt if last else "", [piece], cached if last else 0)
+                await asyncio.sleep(delay / 2 / len(pieces))
+
+        return stream()
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def send(client, scenario: str, i: int) -> bool:
+    if scenario == "summary":
+        response = await client.post("/monthly-summary", json={"month": SUMMARY_MONTHS[i % len(SUMMARY_MONTHS)]})
+        return response.status_code == 200
+    response = await client.post(f"/{scenario}-agent/prompt", json={"prompt": AGENT_PROMPTS[scenario]})
+    return response.status_code == 200
+
+
+async def run_load(client, scenario: str, requests: int, concurrency: int, offset: int = 0) -> Dict[str, Any]:
+    """Send `requests` requests from `concurrency` workers; latency is per request, wall time overall."""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                ok = await send(client, scenario, offset + i)
+            except Exception as e:
+                print(f"{scenario} request failed: {e}")
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2),
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 2),
+        "p50_ms": round(1000 * percentile(latencies, 50), 2),
+        "p95_ms": round(1000 * percentile(latencies, 95), 2),
+        "p99_ms": round(1000 * percentile(latencies, 99), 2),
+        "max_ms": round(1000 * latencies[-1], 2),
+    }
+
+
+def datasets(args, seed_db: Dict):
+    """(name, db) for every --sizes entry (seed rows scaled up) or --datasets file."""
+    from generate_transactions import read_dataset
+
+    for path in args.datasets or []:
+        yield path, read_dataset(path)
+    if not args.datasets:
+        for size in args.sizes:
+            db = json.loads(json.dumps(seed_db))
+            db["transactions"] = scaled_transactions(seed_db["transactions"], size, args.seed)
+            yield None, db
+
+
+async def load_dataset(args, db: Dict, workdir: str):
+    """Put a dataset into the selected backend and reset the app's caches."""
+    import httpx
+    import db_client
+    import tools
+    from storage import storage
+    from summary_cache import summary_cache
+
+    if args.storage == "sqlite":
+        path = os.path.join(workdir, "db.json")
+        with open(path, "w") as f:
+            json.dump(db, f)
+        storage.import_json_db(path)
+    else:
+        await db_client.close_client()
+        server = FakeJsonServer(db, args.db_latency)
+        db_client._client = httpx.AsyncClient(
+            base_url=db_client.JSON_SERVER_URL, transport=httpx.MockTransport(server.handle)
+        )
+    tools.transactions_repo.invalidate()
+    summary_cache.clear()
+
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+    import llm_config
+    import main
+    from storage import storage
+
+    with open(DB_JSON) as f:
+        seed_db = json.load(f)
+    fake = FakeGemini(args.llm_latency, args.llm_jitter, args.function_calls, args.seed)
+    llm_config.client = fake
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://budgy.benchmark", timeout=None) as client:
+        for dataset, db in datasets(args, seed_db):
+            size = len(db["transactions"])
+            await load_dataset(args, db, args.workdir)
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    if args.warmup:
+                        await run_load(client, scenario, args.warmup, min(concurrency, args.warmup))
+                    calls_before = fake.calls
+                    # Offset the summary months so a run does not only hit what warmup cached
+                    stats = await run_load(client, scenario, args.requests, concurrency, offset=args.warmup)
+                    stats["llm_calls"] = fake.calls - calls_before
+                    results.append({"scenario": scenario, "transactions": size, "dataset": dataset, "concurrency": concurrency, **stats})
+                    print(
+                        f"{scenario:>8} {size:>9} {concurrency:>5} {stats['throughput_rps']:>9.1f}/s "
+                        f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['errors']:>6}"
+                    )
+    await storage.close()
+    return {"meta": run_metadata(args), "results": results}
+
+
+def run_metadata(args) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    options = {k: v for k, v in vars(args).items() if k not in ("output", "compare", "workdir")}
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options,
+        "env": {k: os.environ[k] for k in sorted(os.environ) if k.startswith(("LLM_", "JSON_SERVER_MAX", "AGENT_"))},
+    }
+
+
+def compare(baseline_path: str, candidate_path: str):
+    """Print the change in throughput and tail latency for every run present in both files."""
+    def by_key(path):
+        with open(path) as f:
+            data = json.load(f)
+        # Runs on the same dataset file (or generated size) and concurrency are compared
+        return data["meta"].get("commit"), {
+            (r["scenario"], r["transactions"], r["concurrency"], r.get("dataset") or ""): r for r in data["results"]
+        }
+
+    old_commit, old = by_key(baseline_path)
+    new_commit, new = by_key(candidate_path)
+    print(f"baseline {(old_commit or '?')[:10]}  candidate {(new_commit or '?')[:10]}")
+    print(f"{'scenario':>8} {'rows':>9} {'conc':>5} {'rps':>16} {'p50 ms':>18} {'p99 ms':>18}")
+    for key in sorted(old.keys() & new.keys()):
+        a, b = old[key], new[key]
+        cells = []
+        for field in ("throughput_rps", "p50_ms", "p99_ms"):
+            change = (b[field] / a[field] - 1) * 100 if a[field] else 0.0
+            cells.append(f"{b[field]:>9.1f} {change:>+6.1f}%")
+        print(f"{key[0]:>8} {key[1]:>9} {key[2]:>5} " + " ".join(cells) + f"  {key[3]}")
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        configure_environment(args, workdir)
+        print(f"{'scenario':>8} {'rows':>9} {'conc':>5} {'rps':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>6}")
+        report = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
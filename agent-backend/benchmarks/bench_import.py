@@ -0,0 +1,155 @@
+"""
+Benchmark of the bulk transaction import (POST /transactions/import) on the SQLite backend:
+rows per second, peak RSS and the longest event-loop stall while an upload is imported, then
+the same upload again, where every row is a duplicate.
+
+    python benchmarks/bench_import.py [--rows 200000 1000000] [--history 100000] [--format ndjson csv]
+
+Every measurement runs in a fresh process, so peak RSS is that of one import. The upload is
+generated with generate_transactions.py into a temporary file first and --history rows are
+stored beforehand, so duplicates are checked against an existing history.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, "..")
+DB_JSON = os.path.join(BACKEND_DIR, "..", "json-server", "db.json")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[200_000], help="rows per upload")
+    parser.add_argument("--history", type=int, default=100_000, help="transactions stored before the import")
+    parser.add_argument("--format", nargs="+", choices=("ndjson", "csv"), default=["ndjson", "csv"])
+    parser.add_argument("--batch-size", type=int, help="IMPORT_BATCH_SIZE for the run")
+    parser.add_argument("--one", nargs=3, metavar=("FORMAT", "ROWS", "WORKDIR"), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def write_upload(path: str, fmt: str, rows: int, seed_db) -> None:
+    from generate_transactions import generate
+
+    # Another seed and a later end than the history, so most rows are new
+    transactions = generate(rows, date(2025, 12, 31), 3, seed_db, seed=1)
+    columns = ("Date", "Category", "Subcategory", "Amount", "Seller")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if fmt == "ndjson":
+            for row in transactions:
+                f.write(json.dumps({c: row.get(c) for c in columns}) + "\n")
+        else:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in transactions:
+                writer.writerow(["" if row.get(c) is None else row[c] for c in columns])
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def import_once(path: str, fmt: str):
+    """Import one upload and report the final counts, the time taken and the longest loop stall."""
+    from transaction_import import file_chunks, import_transactions
+
+    stall = 0.0
+
+    async def ticker():
+        # How late a 10 ms sleep wakes up is how long the loop was blocked
+        nonlocal stall
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stall = max(stall, time.perf_counter() - started - 0.01)
+
+    watcher = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    async for report in import_transactions(file_chunks(open(path, "rb")), fmt):
+        pass
+    seconds = time.perf_counter() - start
+    watcher.cancel()
+    return report, seconds, stall
+
+
+def run_one(fmt: str, rows: int, workdir: str) -> dict:
+    """One measurement, in this (fresh) process."""
+    sys.path.insert(0, BACKEND_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    upload = os.path.join(workdir, f"upload-{rows}.{fmt}")
+    with open(DB_JSON, encoding="utf-8") as f:
+        seed_db = json.load(f)
+    if not os.path.exists(upload):
+        write_upload(upload, fmt, rows, seed_db)
+
+    baseline = peak_rss_mb()
+    results = {}
+    for run in ("new", "duplicates"):
+        report, seconds, stall = asyncio.run(import_once(upload, fmt))
+        results[run] = {
+            "rows": report["rows"],
+            "imported": report["imported"],
+            "duplicates": report["duplicates"],
+            "seconds": round(seconds, 2),
+            "rows_per_s": round(report["rows"] / seconds),
+            "max_stall_ms": round(stall * 1000, 1),
+        }
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    results["baseline_rss_mb"] = round(baseline, 1)
+    return results
+
+
+def main():
+    args = parse_args()
+    if args.one:
+        fmt, rows, workdir = args.one
+        print(json.dumps(run_one(fmt, int(rows), workdir)))
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    from generate_transactions import generate, write_sqlite
+
+    with open(DB_JSON, encoding="utf-8") as f:
+        seed_db = json.load(f)
+    print(f"{'format':>7} {'rows':>9} {'run':>10} {'imported':>9} {'seconds':>8} {'rows/s':>9} {'stall ms':>9} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        history = os.path.join(workdir, "history.db")
+        write_sqlite(history, generate(args.history, date(2024, 12, 31), 10, seed_db), seed_db)
+        for fmt in args.format:
+            for rows in args.rows:
+                # Every measurement starts from the same stored history
+                db = os.path.join(workdir, "budgy.db")
+                with open(history, "rb") as src, open(db, "wb") as dst:
+                    dst.write(src.read())
+                env = {
+                    **os.environ,
+                    "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "benchmark"),
+                    "STORAGE_BACKEND": "sqlite",
+                    "STORAGE_DB_PATH": db,
+                }
+                if args.batch_size:
+                    env["IMPORT_BATCH_SIZE"] = str(args.batch_size)
+                out = subprocess.run(
+                    [sys.executable, __file__, "--one", fmt, str(rows), workdir],
+                    env=env, capture_output=True, text=True, check=True,
+                ).stdout
+                result = json.loads(out.strip().splitlines()[-1])
+                for run in ("new", "duplicates"):
+                    r = result[run]
+                    print(
+                        f"{fmt:>7} {rows:>9} {run:>10} {r['imported']:>9} {r['seconds']:>8.2f} "
+                        f"{r['rows_per_s']:>9} {r['max_stall_ms']:>9.1f} {result['peak_rss_mb']:>8.1f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
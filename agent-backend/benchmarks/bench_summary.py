@@ -0,0 +1,133 @@
+"""
+Benchmark of the monthly summary statistics: the dict-based loops used before
+MonthlyAggregates versus the materialised per-month aggregates.
+
+    python benchmarks/bench_summary.py [--sizes 1000 100000 1000000]
+    python benchmarks/bench_summary.py --datasets history-1m.ndjson history-10m.db
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from monthly_aggregates import MonthlyAggregates  # noqa: E402
+from transaction_store import TransactionRepository  # noqa: E402
+from generate_transactions import read_dataset  # noqa: E402
+
+DB_JSON = os.path.join(os.path.dirname(__file__), "..", "..", "json-server", "db.json")
+
+
+def make_rows(n: int, seed: int = 0) -> List[Dict]:
+    """n transactions spread over ten years, using the vocabulary of the seeded db.json."""
+    with open(DB_JSON) as f:
+        seed_rows = json.load(f)["transactions"]
+    vocabulary = [(t["Category"], t["Subcategory"], t["Seller"]) for t in seed_rows]
+    rng = random.Random(seed)
+    start = date(2016, 1, 1)
+    rows = []
+    for i in range(n):
+        category, subcategory, seller = rng.choice(vocabulary)
+        rows.append({
+            "Date": (start + timedelta(days=rng.randrange(3650))).isoformat(),
+            "Category": category,
+            "Subcategory": subcategory,
+            "Amount": round(rng.uniform(-300, -1), 2),
+            "Seller": seller,
+            "id": f"{i:x}",
+        })
+    rows.sort(key=lambda t: t["Date"])
+    return rows
+
+
+def dict_month_summary(rows: List[Dict], month: str, prev_month: str) -> Dict:
+    """The pre-columnar path: filter both months by scanning, then loop over dicts."""
+    def total_by_category(txns):
+        cat_tot = {}
+        for t in txns:
+            cat_tot[t["Category"]] = cat_tot.get(t["Category"], 0.0) + float(t["Amount"])
+        return {k: round(v, 2) for k, v in cat_tot.items()}
+
+    txns = [t for t in rows if t["Date"].startswith(month)]
+    prev_txns = [t for t in rows if t["Date"].startswith(prev_month)]
+    actual = total_by_category(txns)
+    top = {}
+    for cat in actual:
+        top[cat] = sorted(
+            [t for t in txns if t["Category"] == cat], key=lambda x: abs(float(x["Amount"])), reverse=True
+        )[:3]
+    return {
+        "totals": actual,
+        "previous_totals": total_by_category(prev_txns),
+        "net_change": round(sum(t["Amount"] for t in txns) - sum(t["Amount"] for t in prev_txns), 2),
+        "top_transactions": top,
+    }
+
+
+def build_aggregates(rows: List[Dict]) -> MonthlyAggregates:
+    """Load rows into a TransactionRepository and build its aggregates, as the app does."""
+    async def load():
+        return rows
+
+    repo = TransactionRepository(load)
+    asyncio.run(repo.refresh())
+    aggregates = MonthlyAggregates(repo)
+    aggregates.rebuild()
+    return aggregates
+
+
+def datasets(args):
+    if args.datasets:
+        for path in args.datasets:
+            yield sorted(read_dataset(path)["transactions"], key=lambda t: t["Date"])
+    else:
+        for n in args.sizes:
+            yield make_rows(n)
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--datasets", nargs="+", metavar="PATH",
+                        help="files from generate_transactions.py to use instead of --sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'dict loops':>12} {'aggregates':>12} {'speedup':>9} {'build':>10}")
+    for rows in datasets(args):
+        n = len(rows)
+        # A month from the middle of the history, and the month before it
+        month = rows[n // 2]["Date"][:7]
+        prev_month = str(np.datetime64(month, "M") - 1)
+        build_start = time.perf_counter()
+        aggregates = build_aggregates(rows)
+        build = time.perf_counter() - build_start
+
+        expected = dict_month_summary(rows, month, prev_month)
+        actual = aggregates.month_summary(month)
+        assert actual["totals"] == expected["totals"], "aggregate totals differ from dict totals"
+        assert actual["previous_totals"] == expected["previous_totals"], "aggregate totals differ from dict totals"
+
+        t_dict = best_of(lambda: dict_month_summary(rows, month, prev_month), args.repeat)
+        t_aggregates = best_of(lambda: aggregates.month_summary(month), args.repeat)
+        print(f"{n:>10} {t_dict * 1000:>10.2f}ms {t_aggregates * 1000:>10.3f}ms {t_dict / t_aggregates:>8.0f}x {build:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Synthetic transaction histories for scaling tests, from 10k to 10M rows. Rows use the
+Category/Subcategory/Seller vocabulary of json-server/db.json, with amounts drawn around
+the seeded amounts of each seller, seasonal spending (travel in summer, shopping before
+Christmas, ...), monthly bills and salary, and a small yearly price drift.
+
+    python benchmarks/generate_transactions.py --rows 1000000 --output history.ndjson
+    python benchmarks/generate_transactions.py --rows 100000 --years 5 --output history.json
+    python benchmarks/generate_transactions.py --rows 10000000 --output history.db
+
+The format follows the extension: .json is a full db.json (the seeded budgets, goals and
+summaries plus the generated transactions) that json-server or `storage.py import` can
+serve, .ndjson has one transaction per line, and .db/.sqlite is a database in the
+SQLiteStorage layout. read_dataset() loads any of them back for the benchmarks.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+DB_JSON = os.path.join(os.path.dirname(__file__), "..", "..", "json-server", "db.json")
+
+# Monthly bills and pay: seller, amount, day of month, months of the year it occurs in
+RECURRING = [
+    ("Student Housing Foundation", -700.00, 1, range(1, 13)),
+    ("University Research Job", 1500.00, 5, range(1, 13)),
+    ("Tech Internship at Nokia", 3000.00, 25, range(6, 9)),
+    ("If Vakuutus", -45.00, 10, range(1, 13)),
+    ("Helsingin Energia", -60.00, 15, range(1, 13)),  # scaled up in winter below
+    ("Elisa", -29.90, 20, range(1, 13)),
+    ("Unisport", -35.00, 3, range(1, 13)),
+    ("Adobe", -24.59, 12, range(1, 13)),
+]
+
+# How much more (or less) a category is bought in each month, January first
+SEASONALITY = {
+    "Leisure": [0.8, 0.8, 0.9, 1.0, 1.1, 1.5, 1.7, 1.4, 1.0, 0.9, 0.8, 1.2],
+    "Transport": [0.9, 0.9, 1.0, 1.0, 1.0, 1.3, 1.5, 1.2, 1.0, 0.9, 0.9, 1.3],
+    "Shopping": [1.1, 0.7, 0.8, 0.9, 0.9, 1.0, 1.0, 0.9, 1.0, 1.0, 1.5, 2.0],
+    "Home Improvements": [0.6, 0.6, 0.9, 1.4, 1.6, 1.4, 1.1, 1.0, 0.9, 0.8, 0.7, 0.6],
+    "Food & Drinks": [0.9, 0.9, 1.0, 1.0, 1.0, 1.1, 1.1, 1.0, 1.0, 1.0, 1.0, 1.3],
+}
+# Prices rise this much per year, relative to the seeded year
+PRICE_DRIFT = 0.02
+
+
+class Vocabulary:
+    """The (Category, Subcategory, Seller) triples of the seed data and the log-amounts seen for each."""
+
+    def __init__(self, seed_rows: List[Dict], recurring_sellers: set):
+        amounts = defaultdict(list)
+        self.by_seller: Dict[str, Tuple[str, str]] = {}
+        for row in seed_rows:
+            self.by_seller.setdefault(row["Seller"], (row["Category"], row["Subcategory"]))
+            if row["Category"] != "Income" and row["Seller"] not in recurring_sellers:
+                amounts[(row["Category"], row["Subcategory"], row["Seller"])].append(abs(float(row["Amount"])))
+
+        self.triples = sorted(amounts)
+        logs = [np.log(amounts[t]) for t in self.triples]
+        self.log_mean = np.array([l.mean() for l in logs])
+        self.log_std = np.array([l.std() if len(l) > 1 else 0.5 for l in logs]).clip(0.2, 1.0)
+        # Every triple starts with the share of seed rows it had
+        share = np.array([len(amounts[t]) for t in self.triples], dtype=np.float64)
+        self.share = share / share.sum()
+        self.season = np.array([SEASONALITY.get(t[0], [1.0] * 12) for t in self.triples]).T  # [month, triple]
+
+
+def _months(start: date, end: date) -> List[Tuple[int, int]]:
+    months, (y, m) = [], (start.year, start.month)
+    while (y, m) <= (end.year, end.month):
+        months.append((y, m))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return months
+
+
+def _days_in(year: int, month: int) -> int:
+    return ((date(year + month // 12, month % 12 + 1, 1)) - date(year, month, 1)).days
+
+
+def generate(rows: int, end: date, years: int, seed_db: Dict, seed: int = 0) -> Iterator[Dict]:
+    """Yield about `rows` transactions in date order over the `years` years up to `end`."""
+    rng = np.random.default_rng(seed)
+    vocab = Vocabulary(seed_db["transactions"], {seller for seller, *_ in RECURRING})
+    first = (end.year - years) * 12 + end.month  # the month after end, `years` years earlier
+    months = _months(date(first // 12, first % 12 + 1, 1), end)
+
+    recurring_rows = sum(m in months_of for _, m in months for _, _, _, months_of in RECURRING)
+    discretionary = max(0, rows - recurring_rows)
+    # Spread the discretionary rows over the months by their seasonal weight
+    weights = np.array([(vocab.season[m - 1] * vocab.share).sum() for _, m in months])
+    per_month = rng.multinomial(discretionary, weights / weights.sum())
+
+    next_id = 0
+    for (year, month), count in zip(months, per_month):
+        days = end.day if (year, month) == (end.year, end.month) else _days_in(year, month)
+        drift = (1 + PRICE_DRIFT) ** (year - 2024)
+        month_rows = []
+
+        for seller, amount, day, months_of in RECURRING:
+            if month not in months_of:
+                continue
+            if seller == "Helsingin Energia":
+                amount *= 1 + 0.6 * np.cos((month - 1) / 12 * 2 * np.pi)  # heating
+            category, subcategory = vocab.by_seller.get(seller, ("Other", "Uncategorized"))
+            month_rows.append((min(day, days), category, subcategory, seller, round(amount * drift, 2)))
+
+        weight = vocab.season[month - 1] * vocab.share
+        picks = rng.choice(len(vocab.triples), size=count, p=weight / weight.sum())
+        amounts = np.exp(rng.normal(vocab.log_mean[picks], vocab.log_std[picks])) * drift
+        for day, pick, amount in zip(rng.integers(1, days + 1, size=count), picks, amounts):
+            category, subcategory, seller = vocab.triples[pick]
+            month_rows.append((int(day), category, subcategory, seller, -round(float(amount), 2)))
+
+        month_rows.sort(key=lambda r: r[0])
+        for day, category, subcategory, seller, amount in month_rows:
+            yield {
+                "Date": f"{year:04d}-{month:02d}-{day:02d}",
+                "Category": category,
+                "Subcategory": subcategory,
+                "Amount": amount,
+                "Seller": seller,
+                "id": f"g{next_id:x}",
+            }
+            next_id += 1
+
+
+def write_json(path: str, transactions: Iterator[Dict], seed_db: Dict) -> int:
+    """A db.json with the seed's other collections, transactions written as they are generated."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        for name, rows in seed_db.items():
+            if name != "transactions":
+                f.write(f"  {json.dumps(name)}: {json.dumps(rows)},\n")
+        f.write('  "transactions": [')
+        for row in transactions:
+            f.write(("\n    " if count == 0 else ",\n    ") + json.dumps(row))
+            count += 1
+        f.write("\n  ]\n}\n")
+    return count
+
+
+def write_ndjson(path: str, transactions: Iterator[Dict]) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for row in transactions:
+            f.write(json.dumps(row) + "\n")
+            count += 1
+    return count
+
+
+def write_sqlite(path: str, transactions: Iterator[Dict], seed_db: Dict) -> int:
+    from storage import SQLiteStorage
+
+    if os.path.exists(path):
+        os.remove(path)
+    db = SQLiteStorage(path)
+    try:
+        # Budget rows repeating a (Month, Category) pair keep the last one, like import_json_db
+        db.insert_many("budgets", {(b["Month"], b["Category"]): b for b in seed_db["budgets"]}.values())
+        for name in ("goals", "summaries"):
+            db.insert_many(name, seed_db.get(name, []))
+        return db.insert_many("transactions", transactions)
+    finally:
+        asyncio.run(db.close())
+
+
+def read_dataset(path: str) -> Dict[str, List[Dict]]:
+    """
+    Load a dataset written by this script (or db.json itself) as db.json-style collections.
+    NDJSON files only hold transactions; the other collections come from the seeded db.json.
+    """
+    if path.endswith(".ndjson"):
+        with open(DB_JSON, encoding="utf-8") as f:
+            db = json.load(f)
+        with open(path, encoding="utf-8") as f:
+            db["transactions"] = [json.loads(line) for line in f if line.strip()]
+        return db
+    if path.endswith((".db", ".sqlite")):
+        conn = sqlite3.connect(path)
+        try:
+            return {
+                name: [json.loads(data) for (data,) in conn.execute(f"SELECT data FROM {name} ORDER BY rowid")]
+                for name in ("transactions", "budgets", "goals", "summaries")
+            }
+        finally:
+            conn.close()
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, required=True, help="transactions to generate (about)")
+    parser.add_argument("--years", type=int, default=10, help="length of the history")
+    parser.add_argument("--end", default="2024-12-31", help="last day of the history (YYYY-MM-DD)")
+    parser.add_argument("--output", required=True, help="file to write: .json, .ndjson, .db or .sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(DB_JSON, encoding="utf-8") as f:
+        seed_db = json.load(f)
+    transactions = generate(args.rows, date.fromisoformat(args.end), args.years, seed_db, args.seed)
+
+    start = time.perf_counter()
+    if args.output.endswith(".ndjson"):
+        count = write_ndjson(args.output, transactions)
+    elif args.output.endswith((".db", ".sqlite")):
+        count = write_sqlite(args.output, transactions, seed_db)
+    elif args.output.endswith(".json"):
+        count = write_json(args.output, transactions, seed_db)
+    else:
+        sys.exit("--output must end in .json, .ndjson, .db or .sqlite")
+    print(f"Wrote {count} transactions to {args.output} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
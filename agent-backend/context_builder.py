@@ -0,0 +1,133 @@
+import json
+import os
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Config
+# Tokens of conversation history embedded into one agent prompt.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Newest messages that are always kept verbatim (if they fit the budget).
+CONTEXT_RECENT_MESSAGES = int(os.getenv("CONTEXT_RECENT_MESSAGES", "6"))
+# Tokens a single tool result may take before it is reduced to aggregates.
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "1000"))
+
+# Length an older message is cut to when it is summarised.
+SUMMARY_CHARS = 200
+# Roughly how many characters Gemini packs into a token for English and JSON text.
+CHARS_PER_TOKEN = 4
+# Tools whose results are already aggregated and bounded in size; cutting them would lose data.
+PRE_AGGREGATED_TOOLS = {"get_spending_snapshot"}
+
+_prompt_stats: Dict[str, Dict[str, int]] = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate; good enough for budgeting, no API call needed."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    text = str(text)
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"... [{len(text) - max_chars} chars omitted]"
+
+
+def render_history(messages: List[Dict], budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    JSON of the conversation history that fits into `budget` tokens.
+    The newest messages are kept verbatim, older ones are replaced by short summaries
+    and the oldest are dropped once the budget is spent.
+    """
+    recent = messages[-CONTEXT_RECENT_MESSAGES:]
+    older = messages[:-CONTEXT_RECENT_MESSAGES] if len(messages) > CONTEXT_RECENT_MESSAGES else []
+
+    # Fill the budget from the newest message backwards
+    kept: List[Dict] = []
+    used = 0
+    for message in reversed(recent):
+        tokens = estimate_tokens(json.dumps(message))
+        if used + tokens > budget:
+            # Does not fit verbatim, fall back to a summary
+            message = {"role": message["role"], "content": _shorten(message["content"], SUMMARY_CHARS)}
+            tokens = estimate_tokens(json.dumps(message))
+            if used + tokens > budget:
+                break
+        kept.append(message)
+        used += tokens
+    else:
+        for message in reversed(older):
+            summary = {"role": message["role"], "content": _shorten(message["content"], SUMMARY_CHARS)}
+            tokens = estimate_tokens(json.dumps(summary))
+            if used + tokens > budget:
+                break
+            kept.append(summary)
+            used += tokens
+
+    kept.reverse()
+    omitted = len(messages) - len(kept)
+    if omitted:
+        kept.insert(0, {"role": "system", "content": f"[{omitted} earlier messages omitted]"})
+    return json.dumps(kept)
+
+
+def _aggregate_transactions(transactions: List[Dict]) -> Dict[str, Any]:
+    by_category: Dict[str, Dict[str, float]] = {}
+    by_month: Dict[str, float] = {}
+    for t in transactions:
+        amount = float(t["Amount"])
+        cat = by_category.setdefault(t["Category"], {"total": 0.0, "count": 0})
+        cat["total"] += amount
+        cat["count"] += 1
+        month = t["Date"][:7]
+        by_month[month] = by_month.get(month, 0.0) + amount
+    largest = sorted(transactions, key=lambda t: abs(float(t["Amount"])), reverse=True)[:5]
+    return {
+        "note": "Raw transactions were aggregated to keep the prompt small.",
+        "total_count": len(transactions),
+        "total_amount": round(sum(by_month.values()), 2),
+        "totals_by_category": {
+            k: {"total": round(v["total"], 2), "count": v["count"]} for k, v in by_category.items()
+        },
+        "totals_by_month": {k: round(v, 2) for k, v in sorted(by_month.items())},
+        "largest_transactions": largest,
+    }
+
+
+def compact_tool_result(tool_name: str, result: Any) -> Any:
+    """Tool result as it should be shown to the LLM, reduced to aggregates if it is too large."""
+    if tool_name in PRE_AGGREGATED_TOOLS:
+        return result
+    if estimate_tokens(json.dumps(result)) <= TOOL_RESULT_TOKEN_BUDGET:
+        return result
+    if isinstance(result, dict) and isinstance(result.get("transactions"), list):
+        return _aggregate_transactions(result["transactions"])
+    if isinstance(result, list):
+        # Keep as many leading items as fit and say how many were cut
+        kept, used = [], 0
+        for item in result:
+            used += estimate_tokens(json.dumps(item))
+            if used > TOOL_RESULT_TOKEN_BUDGET:
+                break
+            kept.append(item)
+        return {"items": kept, "omitted_count": len(result) - len(kept)}
+    return _shorten(json.dumps(result), TOOL_RESULT_TOKEN_BUDGET * CHARS_PER_TOKEN)
+
+
+def record_prompt(agent: str, prompt: str) -> int:
+    """Estimate and record the size of an assembled prompt. Returns the token count."""
+    tokens = estimate_tokens(prompt)
+    stats = _prompt_stats.setdefault(agent, {"prompts": 0, "total_tokens": 0, "max_tokens": 0, "last_tokens": 0})
+    stats["prompts"] += 1
+    stats["total_tokens"] += tokens
+    stats["max_tokens"] = max(stats["max_tokens"], tokens)
+    stats["last_tokens"] = tokens
+    return tokens
+
+
+def get_prompt_stats() -> Dict[str, Dict[str, int]]:
+    return {agent: dict(stats) for agent, stats in _prompt_stats.items()}
@@ -0,0 +1,138 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Config
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "memory")  # memory | sqlite
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+# Idle seconds after which a session is forgotten.
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(60 * 60 * 24)))
+# Messages kept per session; older ones are dropped first.
+CONVERSATION_MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "50"))
+# Sessions kept by the in-memory store before the least recently used one is evicted.
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+
+
+class ConversationStore:
+    """Message histories keyed by session id. Subclasses provide the storage."""
+
+    def __init__(self, namespace: str, ttl: float = CONVERSATION_TTL, max_messages: int = CONVERSATION_MAX_MESSAGES):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    def load(self, session_id: str) -> List[Dict]:
+        """Return the session's messages, or an empty list for unknown or expired sessions."""
+        raise NotImplementedError
+
+    def save(self, session_id: str, messages: List[Dict]):
+        """Store the session's messages, keeping only the newest max_messages."""
+        raise NotImplementedError
+
+    def clear(self, session_id: str):
+        raise NotImplementedError
+
+    def _trim(self, messages: List[Dict]) -> List[Dict]:
+        return list(messages[-self.max_messages:])
+
+
+class InMemoryConversationStore(ConversationStore):
+    """LRU of sessions held in this process."""
+
+    def __init__(self, namespace: str, max_sessions: int = CONVERSATION_MAX_SESSIONS, **kwargs):
+        super().__init__(namespace, **kwargs)
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+
+    def _evict_expired(self, now: float):
+        # Sessions are ordered by last use, so expired ones sit at the front
+        while self._sessions:
+            session_id, (touched, _) = next(iter(self._sessions.items()))
+            if now - touched <= self.ttl:
+                break
+            del self._sessions[session_id]
+
+    def load(self, session_id: str) -> List[Dict]:
+        now = time.time()
+        self._evict_expired(now)
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return []
+        self._sessions[session_id] = (now, entry[1])
+        self._sessions.move_to_end(session_id)
+        return list(entry[1])
+
+    def save(self, session_id: str, messages: List[Dict]):
+        now = time.time()
+        self._sessions[session_id] = (now, self._trim(messages))
+        self._sessions.move_to_end(session_id)
+        self._evict_expired(now)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def clear(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """On-disk store, shared by every uvicorn worker pointing at the same file."""
+
+    def __init__(self, namespace: str, path: str = CONVERSATION_DB_PATH, **kwargs):
+        super().__init__(namespace, **kwargs)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                namespace TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                messages TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, session_id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations(updated_at)")
+
+    def load(self, session_id: str) -> List[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages, updated_at FROM conversations WHERE namespace = ? AND session_id = ?",
+                (self.namespace, session_id),
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return []
+        return json.loads(row[0])
+
+    def save(self, session_id: str, messages: List[Dict]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations (namespace, session_id, messages, updated_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, session_id, json.dumps(self._trim(messages)), now),
+            )
+            self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (now - self.ttl,))
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM conversations WHERE namespace = ? AND session_id = ?",
+                (self.namespace, session_id),
+            )
+
+
+def create_conversation_store(namespace: str) -> ConversationStore:
+    """Build the store selected by the CONVERSATION_STORE env variable."""
+    if CONVERSATION_STORE == "memory":
+        return InMemoryConversationStore(namespace)
+    if CONVERSATION_STORE == "sqlite":
+        return SQLiteConversationStore(namespace)
+    raise ValueError(f"Unknown CONVERSATION_STORE: {CONVERSATION_STORE}")
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from telemetry import JSON_SERVER_LATENCY, span
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Config
+# Only needed with the json-server storage backend
+JSON_SERVER_URL = os.getenv("JSON_SERVER_URL")
+
+# Seconds before a JSON server round-trip is abandoned.
+JSON_SERVER_TIMEOUT = float(os.getenv("JSON_SERVER_TIMEOUT", "10"))
+# Size of the keep-alive connection pool shared by every tool.
+JSON_SERVER_MAX_CONNECTIONS = int(os.getenv("JSON_SERVER_MAX_CONNECTIONS", "20"))
+# Maximum number of requests in flight against the JSON server at once.
+JSON_SERVER_MAX_CONCURRENCY = int(os.getenv("JSON_SERVER_MAX_CONCURRENCY", "10"))
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the process-wide async client, creating it on first use."""
+    global _client
+    if not JSON_SERVER_URL:
+        raise ValueError("JSON_SERVER_URL is not set in the .env file")
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=JSON_SERVER_URL,
+            timeout=httpx.Timeout(JSON_SERVER_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=JSON_SERVER_MAX_CONNECTIONS,
+                max_keepalive_connections=JSON_SERVER_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(JSON_SERVER_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def request(method: str, path: str, **kwargs) -> httpx.Response:
+    """Send a request to the JSON server and raise on HTTP errors."""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        with span("json_server.request", method=method, path=path):
+            async with _get_semaphore():
+                response = await get_client().request(method, path, **kwargs)
+        status = str(response.status_code)
+    finally:
+        JSON_SERVER_LATENCY.labels(method=method, status=status).observe(time.perf_counter() - start)
+    response.raise_for_status()  # Raise an error for HTTP errors
+    return response
+
+
+async def get_json(path: str, **kwargs):
+    response = await request("GET", path, **kwargs)
+    return response.json()
+
+
+async def close_client():
+    """Close the shared client. Called when the FastAPI app shuts down."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,6 +1,15 @@
+import asyncio
+import json
 import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 from google import genai
+from google.genai import errors, types
+
+from context_builder import estimate_tokens
+from telemetry import LLM_LATENCY, LLM_TOKENS, record_cache, record_span
 
 
 # Load environment variables from .env file
@@ -11,11 +20,300 @@ api_key = os.getenv("GEMINI_API_KEY")
 if not api_key:
     raise ValueError("GEMINI_API_KEY is not set in the .env file")
 
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+# Seconds before a single LLM call is abandoned.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# Maximum concurrent calls per model for this process.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Retries on rate limiting (429) and server errors (5xx), with exponential backoff.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+# Static prompt parts go through Gemini context caching when on (on | off). Off by default:
+# caches are billed for storage while they live, so enable it where the prompts are reused.
+LLM_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "off")
+# Seconds a context cache lives; it is recreated shortly before it expires.
+LLM_CONTEXT_CACHE_TTL = int(os.getenv("LLM_CONTEXT_CACHE_TTL", "3600"))
+# Gemini rejects caches below a model-specific size; smaller static parts are sent inline.
+LLM_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("LLM_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+# Seconds before a cache that failed to be created (timeout, 429, 5xx) is tried again;
+# doubles with every failure in a row, up to LLM_CONTEXT_CACHE_TTL.
+LLM_CONTEXT_CACHE_RETRY = float(os.getenv("LLM_CONTEXT_CACHE_RETRY", "30"))
+
+# The one Gemini client of the backend. Every agent goes through this module so the
+# underlying HTTP connections are reused and outbound concurrency can be capped.
 client = genai.Client(api_key=api_key)
 
-def get_llm_response(prompt: str, model: str = "gemini-2.0-flash") -> str:
+_model_semaphores: Dict[str, asyncio.Semaphore] = {}
+_stats: Dict[str, Dict[str, float]] = {}
+# (prompt key, model) -> (cache name, expiry as time.time())
+_context_caches: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_context_cache_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+_uncacheable: Set[Tuple[str, str]] = set()
+# (prompt key, model) -> (failures in a row, time.time() of the next attempt)
+_context_cache_backoff: Dict[Tuple[str, str], Tuple[int, float]] = {}
+
+
+def _get_semaphore(model: str) -> asyncio.Semaphore:
+    if model not in _model_semaphores:
+        _model_semaphores[model] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _model_semaphores[model]
+
+
+def _is_retryable(e: Exception) -> bool:
+    return isinstance(e, errors.APIError) and (e.code == 429 or 500 <= (e.code or 0) < 600)
+
+
+def _is_refusal(e: Exception) -> bool:
+    # A 4xx other than a timeout or rate limit: the request itself is refused (content too
+    # small, model without caching), so sending it again won't help
+    return isinstance(e, errors.APIError) and 400 <= (e.code or 0) < 500 and e.code not in (408, 429)
+
+
+def _record(agent: str, model: str, latency: float, response=None, error: bool = False, retries: int = 0):
+    stats = _stats.setdefault(f"{agent}:{model}", {
+        "calls": 0,
+        "errors": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "cached_tokens": 0,
+        "output_tokens": 0,
+        "total_latency_s": 0.0,
+    })
+    stats["calls"] += 1
+    stats["errors"] += int(error)
+    stats["retries"] += retries
+    stats["total_latency_s"] += latency
+    LLM_LATENCY.labels(agent=agent, model=model, outcome="error" if error else "ok").observe(latency)
+    record_span("llm.generate", latency, error=error, agent=agent, model=model, retries=retries)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        stats["prompt_tokens"] += usage.prompt_token_count or 0
+        stats["cached_tokens"] += usage.cached_content_token_count or 0
+        stats["output_tokens"] += usage.candidates_token_count or 0
+        LLM_TOKENS.labels(agent=agent, model=model, kind="prompt").inc(usage.prompt_token_count or 0)
+        LLM_TOKENS.labels(agent=agent, model=model, kind="cached").inc(usage.cached_content_token_count or 0)
+        LLM_TOKENS.labels(agent=agent, model=model, kind="output").inc(usage.candidates_token_count or 0)
+
+
+def tool_config(declarations: List[Dict[str, Any]]) -> types.GenerateContentConfig:
+    """
+    Generation config declaring functions the model may call. Each declaration has a name,
+    a description and optionally parameters_json_schema. Build it once and reuse it.
+    """
+    return types.GenerateContentConfig(
+        tools=[types.Tool(function_declarations=[types.FunctionDeclaration(**d) for d in declarations])],
+        # The agents run the tools themselves
+        automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+    )
+
+
+def _inline_config(system_instruction: str, declarations: Optional[List[Dict[str, Any]]]) -> types.GenerateContentConfig:
+    config = tool_config(declarations) if declarations else types.GenerateContentConfig()
+    config.system_instruction = system_instruction
+    return config
+
+
+async def prompt_config(
+    key: str,
+    system_instruction: str,
+    declarations: Optional[List[Dict[str, Any]]] = None,
+    model: str = DEFAULT_MODEL,
+) -> types.GenerateContentConfig:
+    """
+    Generation config carrying the static part of a prompt: its system instruction and the
+    functions it declares. Held in a Gemini context cache (created on first use under `key`,
+    renewed before it expires) so each call only sends and pays for the dynamic contents.
+    Sent inline instead when caching is off, the static part is too small, or Gemini
+    refuses the cache.
+    """
+    inline = _inline_config(system_instruction, declarations)
+    cache_key = (key, model)
+    if (
+        LLM_CONTEXT_CACHE == "off"
+        or cache_key in _uncacheable
+        or time.time() < _context_cache_backoff.get(cache_key, (0, 0.0))[1]
+        or estimate_tokens(system_instruction + json.dumps(declarations or [])) < LLM_CONTEXT_CACHE_MIN_TOKENS
+    ):
+        return inline
+
+    lock = _context_cache_locks.setdefault(cache_key, asyncio.Lock())
+    async with lock:
+        cached = _context_caches.get(cache_key)
+        # Renew a minute early so no call is sent with a cache that expires in flight
+        fresh = cached is not None and cached[1] - time.time() > 60
+        record_cache("context_cache", fresh)
+        if not fresh:
+            try:
+                cache = await asyncio.wait_for(
+                    client.aio.caches.create(
+                        model=model,
+                        config=types.CreateCachedContentConfig(
+                            display_name=f"budgy-{key}",
+                            system_instruction=system_instruction,
+                            tools=inline.tools,
+                            ttl=f"{LLM_CONTEXT_CACHE_TTL}s",
+                        ),
+                    ),
+                    timeout=LLM_TIMEOUT,
+                )
+            except Exception as e:
+                if _is_refusal(e):
+                    print(f"Context cache for {key} refused, sending the prompt inline: {e}")
+                    _uncacheable.add(cache_key)
+                else:
+                    # Timeouts, rate limits and server errors pass; try again after a backoff
+                    failures = _context_cache_backoff.get(cache_key, (0, 0.0))[0] + 1
+                    delay = min(LLM_CONTEXT_CACHE_RETRY * 2 ** (failures - 1), LLM_CONTEXT_CACHE_TTL)
+                    _context_cache_backoff[cache_key] = (failures, time.time() + delay)
+                    print(f"Context cache for {key} unavailable, sending the prompt inline for {delay:g}s: {e!r}")
+                return inline
+            _context_cache_backoff.pop(cache_key, None)
+            cached = (cache.name, time.time() + LLM_CONTEXT_CACHE_TTL)
+            _context_caches[cache_key] = cached
+
+    return types.GenerateContentConfig(
+        cached_content=cached[0],
+        automatic_function_calling=inline.automatic_function_calling,
+    )
+
+
+async def close_context_caches():
+    """Delete the context caches of this process instead of paying for them until they expire."""
+    for name, _ in list(_context_caches.values()):
+        try:
+            await client.aio.caches.delete(name=name)
+        except Exception as e:
+            print(f"Error deleting context cache {name}: {e}")
+    _context_caches.clear()
+
+
+def _chunk_parts(chunk):
+    """Text pieces and function calls of one streamed chunk, in order."""
+    for candidate in (chunk.candidates or [])[:1]:
+        for part in (candidate.content.parts if candidate.content else None) or []:
+            if part.function_call is not None:
+                yield part.function_call
+            elif part.text and not part.thought:
+                yield part.text
+
+
+def get_llm_stats() -> Dict[str, Dict[str, float]]:
+    """Token and latency totals per agent and model since the process started."""
+    return {key: dict(value) for key, value in _stats.items()}
+
+
+async def get_llm_response(prompt: str, model: str = DEFAULT_MODEL, timeout: float = LLM_TIMEOUT, agent: str = "default"):
+    # Uses the SDK's async interface so the event loop keeps serving other requests
+    # while Gemini is thinking. Cancelling the awaiting task cancels the HTTP call.
+    retries = 0
+    start = time.perf_counter()
+    while True:
+        try:
+            async with _get_semaphore(model):
+                response = await asyncio.wait_for(
+                    client.aio.models.generate_content(model=model, contents=prompt),
+                    timeout=timeout,
+                )
+            _record(agent, model, time.perf_counter() - start, response, retries=retries)
+            return response
+        except asyncio.TimeoutError:
+            _record(agent, model, time.perf_counter() - start, error=True, retries=retries)
+            raise RuntimeError(f"Failed to generate LLM response: timed out after {timeout:g}s")
+        except Exception as e:
+            if _is_retryable(e) and retries < LLM_MAX_RETRIES:
+                # Full jitter keeps a burst of rate-limited calls from retrying in lockstep
+                await asyncio.sleep(random.uniform(0, LLM_RETRY_BASE_DELAY * 2 ** retries))
+                retries += 1
+                continue
+            _record(agent, model, time.perf_counter() - start, error=True, retries=retries)
+            raise RuntimeError(f"Failed to generate LLM response: {str(e)}")
+
+
+async def stream_llm_response(
+    prompt: str,
+    model: str = DEFAULT_MODEL,
+    timeout: float = LLM_TIMEOUT,
+    agent: str = "default",
+    config: Optional[types.GenerateContentConfig] = None,
+    usage: Optional[Dict[str, int]] = None,
+):
+    """
+    Yield the text chunks of a reply as Gemini streams them, and a types.FunctionCall for each
+    function the model calls (with a config from tool_config). Retries like get_llm_response
+    until the first chunk arrives; `timeout` bounds the whole stream. If given, `usage` is
+    filled with the reply's prompt_tokens (cached ones included), cached_tokens and output_tokens.
+    """
+    retries = 0
+    start = time.perf_counter()
+    deadline = start + timeout
+    semaphore = _get_semaphore(model)
+    # The slot is held from the acquire until the stream is done, however it ends: a
+    # cancelled request (client disconnect, turn deadline) must give it back too
+    held = False
+    stream = None
+    try:
+        # The request is only sent once the first chunk is awaited, so retry around that
+        while True:
+            await semaphore.acquire()
+            held = True
+            try:
+                stream = await client.aio.models.generate_content_stream(model=model, contents=prompt, config=config)
+                first = await asyncio.wait_for(stream.__anext__(), timeout=deadline - time.perf_counter())
+                break
+            except StopAsyncIteration:
+                first = None
+                break
+            except asyncio.TimeoutError:
+                _record(agent, model, time.perf_counter() - start, error=True, retries=retries)
+                raise RuntimeError(f"Failed to generate LLM response: timed out after {timeout:g}s")
+            except Exception as e:
+                await _close_stream(stream)
+                stream = None
+                semaphore.release()
+                held = False
+                if _is_retryable(e) and retries < LLM_MAX_RETRIES:
+                    await asyncio.sleep(random.uniform(0, LLM_RETRY_BASE_DELAY * 2 ** retries))
+                    retries += 1
+                    continue
+                _record(agent, model, time.perf_counter() - start, error=True, retries=retries)
+                raise RuntimeError(f"Failed to generate LLM response: {str(e)}")
+
+        last = None
+        try:
+            chunk = first
+            while chunk is not None:
+                for part in _chunk_parts(chunk):
+                    yield part
+                last = chunk
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=deadline - time.perf_counter())
+                except StopAsyncIteration:
+                    chunk = None
+            # Usage totals arrive with the last chunk
+            _record(agent, model, time.perf_counter() - start, last, retries=retries)
+            metadata = getattr(last, "usage_metadata", None)
+            if usage is not None and metadata is not None:
+                usage["prompt_tokens"] = metadata.prompt_token_count or 0
+                usage["cached_tokens"] = metadata.cached_content_token_count or 0
+                usage["output_tokens"] = metadata.candidates_token_count or 0
+        except asyncio.TimeoutError:
+            _record(agent, model, time.perf_counter() - start, error=True, retries=retries)
+            raise RuntimeError(f"Failed to generate LLM response: timed out after {timeout:g}s")
+        except Exception as e:
+            _record(agent, model, time.perf_counter() - start, error=True, retries=retries)
+            raise RuntimeError(f"Failed to generate LLM response: {str(e)}")
+    finally:
+        await _close_stream(stream)
+        if held:
+            semaphore.release()
+
+
+async def _close_stream(stream):
+    """Close a Gemini response stream, releasing its HTTP connection."""
+    aclose = getattr(stream, "aclose", None)
+    if aclose is None:
+        return
     try:
-        response = client.models.generate_content(model=model, contents=prompt)
-        return response
+        await aclose()
     except Exception as e:
-        raise RuntimeError(f"Failed to generate LLM response: {str(e)}")
\ No newline at end of file
+        print(f"Error closing LLM stream: {e}")
@@ -1,13 +1,28 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
 import json
+import time
 from datetime import datetime, timedelta
 from uuid import uuid4
 from routes import router
+from storage import storage
+from llm_config import close_context_caches
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from telemetry import REQUEST_LATENCY, setup_tracing, shutdown_tracing, span
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_tracing()
+    yield
+    # Release the storage backend's connections
+    await storage.close()
+    await close_context_caches()
+    shutdown_tracing()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +32,26 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    # Latency per route template (not raw path) so ids don't create new series
+    start = time.perf_counter()
+    status = "500"
+    try:
+        with span("http.request", method=request.method, path=request.url.path):
+            response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_LATENCY.labels(
+            method=request.method, route=getattr(route, "path", "unmatched"), status=status
+        ).observe(time.perf_counter() - start)
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # Include routes from routes.py
 app.include_router(router)
 
@@ -0,0 +1,147 @@
+import heapq
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from transaction_record import Transaction
+from transaction_store import TransactionRepository
+
+
+def _previous_month(month: str) -> str:
+    return (datetime.strptime(month + "-01", "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m")
+
+
+class _Cell:
+    """Sum, count, min and max of one (month, category, subcategory), in integer cents."""
+
+    __slots__ = ("sum", "count", "min", "max", "stale")
+
+    def __init__(self):
+        self.sum = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.stale = False
+
+    def add(self, cents: int):
+        self.sum += cents
+        self.count += 1
+        if not self.stale:
+            self.min = cents if self.min is None else min(self.min, cents)
+            self.max = cents if self.max is None else max(self.max, cents)
+
+    def remove(self, cents: int):
+        self.sum -= cents
+        self.count -= 1
+        # The next min/max is unknown without the rows; recompute it when it is read
+        if cents == self.min or cents == self.max:
+            self.stale = True
+
+
+class MonthlyAggregates:
+    """
+    Materialised per-(month, category, subcategory) sum, count, min and max of the
+    transactions in a TransactionRepository. Kept up to date from the repository's row
+    changes, so a month's totals cost one lookup per category instead of a pass over its
+    transactions. Rebuilt from scratch when it drifts from the repository (a change it did
+    not see, e.g. the first load, or a row count that no longer matches).
+    """
+
+    def __init__(self, repo: TransactionRepository):
+        self._repo = repo
+        self._months: Dict[str, Dict[Tuple[str, Optional[str]], _Cell]] = {}
+        self._count = 0
+        self._version: Optional[int] = None
+        repo.subscribe_rows(self._on_change)
+
+    def _add(self, row: Transaction):
+        cells = self._months.setdefault(row.month, {})
+        cells.setdefault((row.category, row.subcategory), _Cell()).add(row.cents)
+        self._count += 1
+
+    def _remove(self, row: Transaction):
+        month = row.month
+        key = (row.category, row.subcategory)
+        cell = self._months.get(month, {}).get(key)
+        if cell is None:
+            self._version = None  # a row we never counted: drifted
+            return
+        cell.remove(row.cents)
+        self._count -= 1
+        if cell.count == 0:
+            del self._months[month][key]
+
+    def _on_change(self, added: List[Transaction], removed: List[Transaction]):
+        if self._version is None:
+            return  # not built yet, or drifted: the next read rebuilds
+        for row in removed:
+            self._remove(row)
+        for row in added:
+            self._add(row)
+        if self._version is not None:
+            self._version = self._repo.version
+
+    def rebuild(self):
+        self._months = {}
+        self._count = 0
+        for row in self._repo.all():
+            self._add(row)
+        self._version = self._repo.version
+
+    def _ensure_current(self):
+        if self._version != self._repo.version or self._count != len(self._repo):
+            self.rebuild()
+
+    def _fresh(self, month: str, key: Tuple[str, Optional[str]], cell: _Cell) -> _Cell:
+        if cell.stale:
+            amounts = [r.cents for r in self._repo.in_month(month, key[0]) if r.subcategory == key[1]]
+            cell.min, cell.max, cell.stale = min(amounts), max(amounts), False
+        return cell
+
+    def category_totals(self, month: str) -> Dict[str, float]:
+        """Total amount per category of a YYYY-MM month."""
+        self._ensure_current()
+        totals: Dict[str, int] = {}
+        for (category, _), cell in self._months.get(month, {}).items():
+            totals[category] = totals.get(category, 0) + cell.sum
+        return {category: cents / 100 for category, cents in totals.items()}
+
+    def month_stats(self, month: str) -> Dict[str, Dict[str, Any]]:
+        """total, count, min and max per category of a YYYY-MM month, and the same per subcategory."""
+        self._ensure_current()
+        stats: Dict[str, Dict[str, Any]] = {}
+        for key, cell in self._months.get(month, {}).items():
+            cell = self._fresh(month, key, cell)
+            category = stats.setdefault(key[0], {"total": 0, "count": 0, "min": cell.min, "max": cell.max, "subcategories": {}})
+            category["total"] += cell.sum
+            category["count"] += cell.count
+            category["min"] = min(category["min"], cell.min)
+            category["max"] = max(category["max"], cell.max)
+            category["subcategories"][key[1]] = {
+                "total": cell.sum / 100, "count": cell.count, "min": cell.min / 100, "max": cell.max / 100,
+            }
+        for category in stats.values():
+            category["total"] /= 100
+            category["min"] /= 100
+            category["max"] /= 100
+        return stats
+
+    def month_summary(self, month: str, top_k: int = 3) -> Dict[str, Any]:
+        """
+        Category totals of a YYYY-MM month and of the month before, the net change between
+        them, and the top_k transactions by absolute amount, which only the most spent
+        (non-income) category needs and so only it gets.
+        """
+        totals = self.category_totals(month)
+        previous = self.category_totals(_previous_month(month))
+        top: Dict[str, List[Dict[str, Any]]] = {}
+        spending = {k: v for k, v in totals.items() if k.lower() != "income"}
+        if spending:
+            category = max(spending, key=lambda k: abs(spending[k]))
+            rows = heapq.nlargest(top_k, self._repo.in_month(month, category), key=lambda r: abs(r.cents))
+            top[category] = [{"Seller": r.seller, "Subcategory": r.subcategory, "Amount": r.amount} for r in rows]
+        return {
+            "totals": totals,
+            "previous_totals": previous,
+            "net_change": round(sum(totals.values()) - sum(previous.values()), 2),
+            "top_transactions": top,
+        }
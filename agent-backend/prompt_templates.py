@@ -0,0 +1,31 @@
+import textwrap
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+
+from context_builder import estimate_tokens
+from llm_config import DEFAULT_MODEL, prompt_config
+
+
+class PromptTemplate:
+    """
+    An agent prompt split in two: the static instructions, compiled once when the agent
+    module is imported and sent as the system instruction (through a Gemini context cache
+    when they are large enough), and a short tail rendered with str.format on every call
+    for what changes: the date, the user input, the history and tool results.
+    """
+
+    def __init__(self, key: str, instructions: str, tail: str, declarations: Optional[List[Dict[str, Any]]] = None):
+        self.key = key
+        self.instructions = textwrap.dedent(instructions).strip()
+        self.tail = textwrap.dedent(tail).strip()
+        self.declarations = declarations
+        self.instruction_tokens = estimate_tokens(self.instructions)
+
+    def render(self, **values) -> str:
+        """The per-call part of the prompt."""
+        return self.tail.format(**values)
+
+    async def config(self, model: str = DEFAULT_MODEL) -> types.GenerateContentConfig:
+        """Generation config carrying the instructions and the declared tools."""
+        return await prompt_config(self.key, self.instructions, self.declarations, model)
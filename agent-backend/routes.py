@@ -1,29 +1,158 @@
-from fastapi import APIRouter
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from goal_agent import handle_goal_agent_prompt
-from budget_agent import handle_budget_agent_prompt
-from summary_agent import generate_monthly_summary
+from goal_agent import handle_goal_agent_prompt, goal_agent_events
+from budget_agent import handle_budget_agent_prompt, budget_agent_events
+from agent_events import event, format_sse
+from agent_turn import get_turn_stats
+from context_builder import get_prompt_stats
+from llm_config import get_llm_stats
+from summary_agent import generate_monthly_summary, generate_monthly_summaries
+from tools import TransactionParams, add_transaction, update_transaction, delete_transaction, transaction_pages
+from transaction_import import file_chunks, import_transactions, spool
+from transaction_record import iso_day
 from typing import Optional
+from uuid import uuid4
 
 router = APIRouter()
 
+# How often (seconds) a pending agent call checks whether the HTTP client went away.
+DISCONNECT_POLL_INTERVAL = 0.5
+
+async def cancel_on_disconnect(request: Request, coro):
+    """Run coro, cancelling it (and any in-flight LLM call) if the client disconnects."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise asyncio.CancelledError("Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
 class GoalAgentRequest(BaseModel):
     prompt: str
+    session_id: Optional[str] = None  # a new session is started when omitted
 
 class BudgetAgentRequest(BaseModel):
     prompt: str
+    session_id: Optional[str] = None  # a new session is started when omitted
 
 @router.post("/goal-agent/prompt")
-async def handle_prompt(request: GoalAgentRequest):
-    return await handle_goal_agent_prompt(request.prompt)
+async def handle_prompt(request: GoalAgentRequest, http_request: Request):
+    session_id = request.session_id or str(uuid4())
+    response = await cancel_on_disconnect(http_request, handle_goal_agent_prompt(request.prompt, session_id))
+    return {**response, "session_id": session_id}
 
 @router.post("/budget-agent/prompt")
-async def handle_prompt(request: BudgetAgentRequest):
-    return await handle_budget_agent_prompt(request.prompt)
+async def handle_prompt(request: BudgetAgentRequest, http_request: Request):
+    session_id = request.session_id or str(uuid4())
+    response = await cancel_on_disconnect(http_request, handle_budget_agent_prompt(request.prompt, session_id))
+    return {**response, "session_id": session_id}
+
+def agent_event_stream(events, session_id: str) -> StreamingResponse:
+    """Server-sent events for one agent turn: the session id first, then the agent's events."""
+    async def stream():
+        yield format_sse(event("session", session_id=session_id))
+        async for item in events:
+            yield format_sse(item)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/goal-agent/prompt/stream")
+async def stream_prompt(request: GoalAgentRequest):
+    session_id = request.session_id or str(uuid4())
+    return agent_event_stream(goal_agent_events(request.prompt, session_id), session_id)
+
+@router.post("/budget-agent/prompt/stream")
+async def stream_prompt(request: BudgetAgentRequest):
+    session_id = request.session_id or str(uuid4())
+    return agent_event_stream(budget_agent_events(request.prompt, session_id), session_id)
+
+@router.get("/agent-stats")
+async def agent_stats():
+    """Per-turn cost and latency of the agents, for capacity planning."""
+    return {"turns": get_turn_stats(), "llm": get_llm_stats(), "prompts": get_prompt_stats()}
 
 class SummaryRequest(BaseModel):
     month: Optional[str] = None       # yyyy-mm; default = last complete month
 
 @router.post("/monthly-summary")
-async def monthly_summary(request: SummaryRequest):
-    return await generate_monthly_summary(request.month)
\ No newline at end of file
+async def monthly_summary(request: SummaryRequest, http_request: Request):
+    return await cancel_on_disconnect(http_request, generate_monthly_summary(request.month))
+
+class SummaryBatchRequest(BaseModel):
+    start_month: str                  # yyyy-mm, inclusive
+    end_month: str                    # yyyy-mm, inclusive
+
+@router.post("/monthly-summary/batch")
+async def monthly_summary_batch(request: SummaryBatchRequest):
+    """Summaries for a month range, streamed as NDJSON lines in the order the months finish."""
+    results = await generate_monthly_summaries(request.start_month, request.end_month)
+
+    async def stream():
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/transactions")
+async def list_transactions(start_date: str, end_date: str, category: Optional[str] = None):
+    # NDJSON, one transaction per line, streamed page by page from the storage backend
+    try:
+        # Stored dates are zero-padded and compared as strings, so 2024-1-5 becomes 2024-01-05
+        start_date, end_date = iso_day(start_date), iso_day(end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date and end_date must be YYYY-MM-DD.")
+    pages = transaction_pages(start_date, end_date, category)
+    # Fetch the first page before answering, so a storage failure is still a 500 response
+    first = await anext(pages, [])
+
+    async def stream():
+        yield "".join(json.dumps(row) + "\n" for row in first)
+        async for page in pages:
+            yield "".join(json.dumps(row) + "\n" for row in page)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/transactions/import")
+async def import_transactions_upload(http_request: Request, format: Optional[str] = None):
+    """
+    Bulk import of an NDJSON or CSV upload (format from the query or the Content-Type).
+    Streams NDJSON progress reports: one per stored batch, then a final one.
+    """
+    content_type = http_request.headers.get("content-type", "")
+    fmt = format or ("csv" if "csv" in content_type else "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv.")
+    upload = await spool(http_request.stream())
+    reports = import_transactions(file_chunks(upload), fmt)
+
+    async def stream():
+        async for report in reports:
+            yield json.dumps(report) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.post("/transactions")
+async def create_transaction(request: TransactionParams):
+    """Add a transaction; the monthly aggregates and summary cache are updated right away."""
+    return await add_transaction(request)
+
+@router.put("/transactions/{transaction_id}")
+async def edit_transaction(transaction_id: str, request: TransactionParams):
+    return await update_transaction(transaction_id, request)
+
+@router.delete("/transactions/{transaction_id}")
+async def remove_transaction(transaction_id: str):
+    return await delete_transaction(transaction_id)
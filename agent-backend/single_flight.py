@@ -0,0 +1,62 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from dotenv import load_dotenv
+
+from telemetry import record_cache
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Seconds a fetched collection is reused by later reads; 0 only shares reads already in flight.
+STORAGE_READ_TTL = float(os.getenv("STORAGE_READ_TTL", "2"))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical reads: the first caller for a key starts the fetch and
+    everyone asking for the same key while it runs awaits that one fetch. The result is then
+    reused for `ttl` seconds. invalidate() drops it after a write, and also detaches any fetch
+    still in flight, since it may have read the collection before the write landed.
+    """
+
+    def __init__(self, name: str, ttl: float = STORAGE_READ_TTL):
+        self.name = name
+        self.ttl = ttl
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._results: Dict[str, Tuple[float, Any]] = {}
+        self._generation: Dict[str, int] = {}
+
+    async def do(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._results.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            record_cache(self.name, True)
+            return cached[1]
+
+        task = self._inflight.get(key)
+        record_cache(self.name, task is not None)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, fetch))
+            # Nobody may be left awaiting it; don't let a failure go unreported as "never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        # A cancelled caller must not cancel the fetch the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        generation = self._generation.get(key, 0)
+        try:
+            result = await fetch()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+        if self.ttl > 0 and self._generation.get(key, 0) == generation:
+            self._results[key] = (time.monotonic(), result)
+        return result
+
+    def invalidate(self, key: str):
+        self._generation[key] = self._generation.get(key, 0) + 1
+        self._results.pop(key, None)
+        self._inflight.pop(key, None)
@@ -0,0 +1,488 @@
+import asyncio
+import itertools
+import json
+import operator
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+import db_client
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Config
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json-server")  # json-server | sqlite
+STORAGE_DB_PATH = os.getenv("STORAGE_DB_PATH", "budgy.db")
+# Rows fetched per round trip by paginated queries.
+STORAGE_PAGE_SIZE = int(os.getenv("STORAGE_PAGE_SIZE", "500"))
+
+# Columns copied out of the row JSON so they can be indexed and filtered on
+_INDEXED_COLUMNS = {
+    "transactions": ("Date", "Category"),
+    "budgets": ("Month", "Category"),
+    "goals": (),
+    "summaries": ("month",),
+}
+
+_SCHEMA = """
+    -- Seeded transaction ids are not unique, so transactions are not keyed by id
+    CREATE TABLE IF NOT EXISTS transactions (
+        id TEXT NOT NULL,
+        Date TEXT NOT NULL,
+        Category TEXT NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS transactions_date_category ON transactions(Date, Category);
+    CREATE INDEX IF NOT EXISTS transactions_id ON transactions(id);
+    -- Duplicate check of bulk imports, which skip rows with a stored (Date, Amount, Seller)
+    CREATE INDEX IF NOT EXISTS transactions_import_key
+        ON transactions(Date, json_extract(data, '$."Amount"'), json_extract(data, '$."Seller"'));
+
+    CREATE TABLE IF NOT EXISTS budgets (
+        id TEXT PRIMARY KEY,
+        Month TEXT NOT NULL,
+        Category TEXT NOT NULL,
+        data TEXT NOT NULL,
+        UNIQUE (Month, Category)
+    );
+
+    CREATE TABLE IF NOT EXISTS goals (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS summaries (
+        id TEXT PRIMARY KEY,
+        month TEXT NOT NULL UNIQUE,
+        data TEXT NOT NULL
+    );
+"""
+
+
+class StorageError(Exception):
+    """A read or write against the storage backend failed."""
+
+
+# Filter suffixes for range conditions, as in json-server's `Date_gte=2024-01-01`
+_RANGE_OPERATORS = {"_gte": ">=", "_lte": "<="}
+_RANGE_TESTS = {">=": operator.ge, "<=": operator.le}
+
+
+def _split_filter(field: str) -> Tuple[str, str]:
+    """`Date_gte` -> ("Date", ">="), `Category` -> ("Category", "=")."""
+    for suffix, op in _RANGE_OPERATORS.items():
+        if field.endswith(suffix):
+            return field[: -len(suffix)], op
+    return field, "="
+
+
+def _split_ranges(filters: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Tuple[str, str, Any]]]:
+    """Equality filters, and the range conditions as (field, operator, bound)."""
+    equal, ranges = {}, []
+    for key, value in (filters or {}).items():
+        field, op = _split_filter(key)
+        if op == "=":
+            equal[key] = value
+        else:
+            ranges.append((field, op, value))
+    return equal, ranges
+
+
+def _first_of_each(rows: List[Dict], unique_on: Tuple[str, ...]) -> List[Dict]:
+    """The rows whose unique_on values no earlier row of the list has."""
+    first = {}
+    for row in rows:
+        first.setdefault(tuple(map(row.get, unique_on)), row)
+    return list(first.values())
+
+
+def _in_ranges(row: Dict, ranges: List[Tuple[str, str, Any]]) -> bool:
+    for field, op, bound in ranges:
+        value = row.get(field)
+        if value is None or not _RANGE_TESTS[op](value, bound):
+            return False
+    return True
+
+
+class StorageBackend:
+    """
+    The transactions, budgets, goals and summaries collections. Rows are plain dicts with
+    an `id`; `filters` are json-server query parameters: fields match by equality, and
+    `<field>_gte` / `<field>_lte` bound a field from below or above.
+    """
+
+    async def list(self, collection: str, filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def pages(
+        self,
+        collection: str,
+        filters: Optional[Dict[str, Any]] = None,
+        sort: Optional[str] = None,
+        page_size: int = STORAGE_PAGE_SIZE,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        The rows matching `filters`, ordered by `sort` (insertion order if None), yielded
+        page_size rows at a time and fetched one page per round trip, so memory follows the
+        page size rather than the size of the collection.
+        """
+        raise NotImplementedError
+
+    async def create(self, collection: str, row: Dict) -> Dict:
+        """Store a new row and return it with its id."""
+        raise NotImplementedError
+
+    async def create_many(self, collection: str, rows: List[Dict], unique_on: Tuple[str, ...] = ()) -> List[Dict]:
+        """
+        Store a batch of new rows and return them with their ids. With unique_on, rows whose
+        values of those fields match a stored row or an earlier row of the batch are skipped,
+        and only the stored rows are returned.
+        """
+        if unique_on:
+            rows = await self._unstored(collection, _first_of_each(rows, unique_on), unique_on)
+        return list(await asyncio.gather(*(self.create(collection, row) for row in rows)))
+
+    async def _unstored(self, collection: str, rows: List[Dict], unique_on: Tuple[str, ...]) -> List[Dict]:
+        # Only the stored rows sharing a first field value with the batch are fetched
+        first = unique_on[0]
+        values = {row.get(first) for row in rows}
+        matches = await asyncio.gather(*(self.list(collection, {first: value}) for value in values))
+        stored = {tuple(row.get(field) for field in unique_on) for same in matches for row in same}
+        return [row for row in rows if tuple(row.get(field) for field in unique_on) not in stored]
+
+    async def update(self, collection: str, row_id: str, row: Dict) -> Dict:
+        """Replace the row with the given id."""
+        raise NotImplementedError
+
+    async def delete(self, collection: str, row_id: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class JsonServerStorage(StorageBackend):
+    """
+    json-server over HTTP, through the pooled client in db_client. json-server 1.0.0-beta.3
+    only applies `_gte`/`_lte` to numeric fields, so they would match no ISO date; range
+    conditions are applied here to the rows it returns instead, and only equality filters,
+    sorting and paging are sent to the server.
+    """
+
+    async def list(self, collection, filters=None):
+        equal, ranges = _split_ranges(filters)
+        try:
+            rows = await db_client.get_json(f"/{collection}", params=equal)
+        except httpx.HTTPError as e:
+            raise StorageError(str(e)) from e
+        return [row for row in rows if _in_ranges(row, ranges)] if ranges else rows
+
+    async def pages(self, collection, filters=None, sort=None, page_size=STORAGE_PAGE_SIZE):
+        filters, ranges = _split_ranges(filters)
+        params = {**filters, "_per_page": page_size}
+        if sort:
+            params["_sort"] = sort
+        # Sorted by a field with an upper bound, the pages after the one that passes it match nothing
+        upper = [bound for field, op, bound in ranges if field == sort and op == "<="]
+        page = 1
+        while page is not None:
+            try:
+                body = await db_client.get_json(f"/{collection}", params={**params, "_page": page})
+            except httpx.HTTPError as e:
+                raise StorageError(str(e)) from e
+            if isinstance(body, list):
+                # A json-server without _per_page support answers with every row at once
+                body, page = {"data": body}, None
+            else:
+                page = body.get("next")
+            rows = [row for row in body["data"] if _in_ranges(row, ranges)]
+            if rows:
+                yield rows
+            if upper and body["data"] and body["data"][-1].get(sort) is not None and body["data"][-1][sort] > min(upper):
+                return
+
+    async def create(self, collection, row):
+        try:
+            response = await db_client.request("POST", f"/{collection}", json=row)
+            return response.json()
+        except httpx.HTTPError as e:
+            raise StorageError(str(e)) from e
+
+    async def update(self, collection, row_id, row):
+        try:
+            response = await db_client.request("PUT", f"/{collection}/{row_id}", json={**row, "id": row_id})
+            return response.json()
+        except httpx.HTTPError as e:
+            raise StorageError(str(e)) from e
+
+    async def delete(self, collection, row_id):
+        try:
+            await db_client.request("DELETE", f"/{collection}/{row_id}")
+        except httpx.HTTPError as e:
+            raise StorageError(str(e)) from e
+
+    async def close(self):
+        # Release the pooled JSON server connections
+        await db_client.close_client()
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Embedded SQLite database, one table per collection. The full row is kept as JSON next
+    to the indexed columns, so writes touch a single row instead of rewriting a file.
+    """
+
+    def __init__(self, path: str = STORAGE_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _columns(self, collection: str):
+        if collection not in _INDEXED_COLUMNS:
+            raise StorageError(f"Unknown collection: {collection}")
+        return _INDEXED_COLUMNS[collection]
+
+    async def _run(self, fn, *args):
+        # sqlite3 blocks, so queries run on a worker thread, one at a time
+        def locked():
+            with self._lock:
+                return fn(*args)
+        try:
+            return await asyncio.to_thread(locked)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def _where(self, collection, filters) -> Tuple[List[str], List[Any]]:
+        # Every table has an id column (indexed), so id lookups don't scan the JSON
+        columns = ("id",) + self._columns(collection)
+        where, values = [], []
+        for key, value in (filters or {}).items():
+            field, op = _split_filter(key)
+            if field in columns:
+                where.append(f'"{field}" {op} ?')
+            else:
+                where.append(f"json_extract(data, ?) {op} ?")
+                values.append(f'$."{field}"')
+            values.append(value)
+        return where, values
+
+    def _list(self, collection, filters):
+        where, values = self._where(collection, filters)
+        query = f"SELECT data FROM {collection}"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        return [json.loads(data) for (data,) in self._conn.execute(query + " ORDER BY rowid", values)]
+
+    def _page(self, collection, filters, sort, after, page_size):
+        # Keyset pagination: continue after the last (sort value, rowid) seen, so every page
+        # is an index range scan instead of an OFFSET that re-reads the pages before it
+        where, values = self._where(collection, filters)
+        if sort is not None and sort not in ("id",) + self._columns(collection):
+            raise StorageError(f"{collection} can't be sorted by {sort}")
+        order = ("rowid",) if sort is None else (f'"{sort}"', "rowid")
+        if after is not None:
+            where.append(f"({', '.join(order)}) > ({', '.join('?' * len(order))})")
+            values.extend(after)
+        query = f"SELECT rowid, {order[0]}, data FROM {collection}"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += f" ORDER BY {', '.join(order)} LIMIT ?"
+        return self._conn.execute(query, values + [page_size]).fetchall()
+
+    def _insert(self, collection, row):
+        columns = ("id",) + self._columns(collection) + ("data",)
+        self._conn.execute(
+            f"INSERT INTO {collection} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [row.get(c) for c in columns[:-1]] + [json.dumps(row)],
+        )
+
+    def _create(self, collection, row):
+        row = {**row, "id": row.get("id") or uuid.uuid4().hex}
+        self._insert(collection, row)
+        return row
+
+    @staticmethod
+    def _with_ids(rows: Iterable[Dict]) -> Iterator[Dict]:
+        # Time-ordered ids: random ones would land all over the id index and double the insert time
+        prefix = f"{time.time_ns():x}{os.urandom(3).hex()}"
+        for i, row in enumerate(rows):
+            yield {**row, "id": row.get("id") or f"{prefix}{i:08x}"}
+
+    def _insert_batch(self, collection, encoded, unique_on=()):
+        """
+        Insert the rows of a JSON array with one statement, skipping those whose unique_on
+        values a stored row has. Returns the number of rows inserted.
+        """
+        # The batch is bound as one JSON array that SQLite splits into rows: one json.dumps of
+        # the batch costs half of one per row, and the split runs without holding the GIL
+        columns = ("id",) + self._columns(collection)
+
+        def value(field, row="batch.value"):
+            # The JSON path is inlined rather than bound, as an expression index only matches the same text
+            return f"json_extract({row}, '$.\"{field}\"')"
+
+        query = (
+            f"INSERT INTO {collection} ({', '.join(columns)}, data) "
+            f"SELECT {', '.join(value(c) for c in columns)}, batch.value FROM json_each(?) AS batch"
+        )
+        if unique_on:
+            # Uses the transactions_import_key index for the import's key
+            matches = " AND ".join(
+                (f'"{field}"' if field in columns else value(field, "data")) + f" IS {value(field)}"
+                for field in unique_on
+            )
+            query += f" WHERE NOT EXISTS (SELECT 1 FROM {collection} WHERE {matches})"
+        return self._conn.execute(query, (encoded,)).rowcount
+
+    def _create_batch(self, collection, encoded, unique_on):
+        # New rows get rowids past the largest one, so they are read back as one JSON array:
+        # RETURNING would take the GIL back once per row, waiting on whatever thread holds it
+        self._conn.execute("BEGIN")
+        try:
+            last = self._conn.execute(f"SELECT max(rowid) FROM {collection}").fetchone()[0] or 0
+            self._insert_batch(collection, encoded, unique_on)
+            (ids,) = self._conn.execute(
+                f"SELECT json_group_array(id) FROM {collection} WHERE rowid > ?", (last,)
+            ).fetchone()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return json.loads(ids)
+
+    def _insert_many(self, collection, rows, batch_size=10_000):
+        rows = iter(rows)
+        count = 0
+        self._conn.execute("BEGIN")
+        try:
+            while batch := list(itertools.islice(rows, batch_size)):
+                count += self._insert_batch(collection, json.dumps(batch))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def _update(self, collection, row_id, row):
+        row = {**row, "id": row_id}
+        columns = self._columns(collection) + ("data",)
+        cursor = self._conn.execute(
+            f"UPDATE {collection} SET {', '.join(c + ' = ?' for c in columns)} "
+            f"WHERE rowid = (SELECT rowid FROM {collection} WHERE id = ? LIMIT 1)",
+            [row.get(c) for c in columns[:-1]] + [json.dumps(row), row_id],
+        )
+        if cursor.rowcount == 0:
+            raise StorageError(f"No row with id {row_id} in {collection}")
+        return row
+
+    def _delete(self, collection, row_id):
+        self._columns(collection)
+        cursor = self._conn.execute(
+            f"DELETE FROM {collection} WHERE rowid = (SELECT rowid FROM {collection} WHERE id = ? LIMIT 1)",
+            (row_id,),
+        )
+        if cursor.rowcount == 0:
+            raise StorageError(f"No row with id {row_id} in {collection}")
+
+    async def list(self, collection, filters=None):
+        return await self._run(self._list, collection, filters)
+
+    async def pages(self, collection, filters=None, sort=None, page_size=STORAGE_PAGE_SIZE):
+        after = None
+        while True:
+            # One query per page, so the connection is free between pages
+            rows = await self._run(self._page, collection, filters, sort, after, page_size)
+            if not rows:
+                return
+            yield [json.loads(data) for _, _, data in rows]
+            if len(rows) < page_size:
+                return
+            rowid, key, _ = rows[-1]
+            after = (rowid,) if sort is None else (key, rowid)
+
+    async def create(self, collection, row):
+        return await self._run(self._create, collection, row)
+
+    def _create_many(self, collection, rows, unique_on):
+        rows = list(self._with_ids(_first_of_each(rows, unique_on) if unique_on else rows))
+        stored = set(self._create_batch(collection, json.dumps(rows), unique_on))
+        return [row for row in rows if row["id"] in stored]
+
+    async def create_many(self, collection, rows, unique_on=()):
+        # One statement per batch instead of a commit per row; the duplicate check is part of
+        # it, so no other write lands in between
+        return await self._run(self._create_many, collection, rows, unique_on)
+
+    async def update(self, collection, row_id, row):
+        return await self._run(self._update, collection, row_id, row)
+
+    async def delete(self, collection, row_id):
+        await self._run(self._delete, collection, row_id)
+
+    async def close(self):
+        self._conn.close()
+
+    def insert_many(self, collection: str, rows: Iterable[Dict], batch_size: int = 10_000) -> int:
+        """
+        Append rows to a collection in one transaction, consuming `rows` lazily in batches so
+        large generated or streamed datasets are never held in memory. Returns the row count.
+        """
+        with self._lock:
+            return self._insert_many(collection, self._with_ids(rows), batch_size)
+
+    def import_json_db(self, path: str) -> Dict[str, int]:
+        """
+        Replace every collection with the contents of a json-server db.json file, in one
+        transaction. Budget rows repeating a (Month, Category) pair keep the last one.
+        Returns the number of rows stored per collection.
+        """
+        with open(path, encoding="utf-8") as f:
+            db = json.load(f)
+
+        counts = {}
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for collection in _INDEXED_COLUMNS:
+                    self._conn.execute(f"DELETE FROM {collection}")
+                    for row in db.get(collection, []):
+                        if collection == "budgets":
+                            self._conn.execute("DELETE FROM budgets WHERE Month = ? AND Category = ?", (row["Month"], row["Category"]))
+                        self._insert(collection, {**row, "id": row.get("id") or uuid.uuid4().hex})
+                    counts[collection] = self._conn.execute(f"SELECT COUNT(*) FROM {collection}").fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return counts
+
+
+def create_storage() -> StorageBackend:
+    """Build the backend selected by the STORAGE_BACKEND env variable."""
+    if STORAGE_BACKEND == "json-server":
+        return JsonServerStorage()
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+storage = create_storage()
+
+
+if __name__ == "__main__":
+    # One-shot import: python storage.py import ../json-server/db.json
+    if len(sys.argv) != 3 or sys.argv[1] != "import":
+        sys.exit("Usage: python storage.py import <path to db.json>")
+    counts = SQLiteStorage().import_json_db(sys.argv[2])
+    for collection, count in counts.items():
+        print(f"{collection}: {count} rows")
+    print(f"Imported into {STORAGE_DB_PATH}")
@@ -2,11 +2,20 @@ from fastapi import HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-import json, re
-from llm_config import get_llm_response
-from tools import get_budget, get_transactions, gather_goal_progress, save_summary
+import asyncio
+import json, os, re
+from llm_config import DEFAULT_MODEL, get_llm_response
+from summary_cache import summary_cache, summary_cache_key
+from telemetry import record_cache
+from tools import budget_for_month, get_budget, get_monthly_aggregates, gather_goal_progress, load_budgets, save_summary
 
 CURRENT_DATE = datetime(2025, 5, 12)
+# Bump whenever the summary prompt below changes, so cached LLM output is not reused.
+SUMMARY_PROMPT_VERSION = "1"
+# LLM narratives generated at once by the batch endpoint.
+SUMMARY_BATCH_CONCURRENCY = int(os.getenv("SUMMARY_BATCH_CONCURRENCY", "4"))
+# Longest month range the batch endpoint accepts; each month is an LLM call.
+SUMMARY_BATCH_MAX_MONTHS = int(os.getenv("SUMMARY_BATCH_MAX_MONTHS", "24"))
 #OUTLINE_RE = re.compile(r"^\s*1\.\s")
 
 
@@ -15,13 +24,6 @@ CURRENT_DATE = datetime(2025, 5, 12)
 def _month_str(dt: datetime) -> str:
     return dt.strftime("%Y-%m")
 
-def total_by_category(txns: List[Dict]) -> Dict[str, float]:
-    cat_tot = {}
-    for t in txns:
-        cat = t["Category"]
-        cat_tot[cat] = cat_tot.get(cat, 0.0) + float(t["Amount"])
-    return {k: round(v, 2) for k, v in cat_tot.items()}
-
 def budget_vs_actual(actual: Dict[str, float], plan: Dict[str, float]) -> Dict[str, float]:
     deltas = {}
     for cat, act_val in actual.items():
@@ -29,19 +31,39 @@ def budget_vs_actual(actual: Dict[str, float], plan: Dict[str, float]) -> Dict[s
             deltas[cat] = round(100*(act_val-plan[cat])/plan[cat], 1)
     return deltas
 
-def build_summary_json(month: str) -> Dict[str, Any]:
-    txns = get_transactions(month)
-    actual = total_by_category(txns)
-    plan   = get_budget(month)
+async def build_summary_json(month: str) -> Dict[str, Any]:
+    # The fetches are independent, so run them concurrently on the shared pool
+    aggregates, plan, goals = await asyncio.gather(
+        get_monthly_aggregates(),
+        get_budget(month),
+        gather_goal_progress(month),
+    )
+    # Totals for this and the previous month come from the materialised aggregates
+    return summary_from_stats(month, aggregates.month_summary(month, top_k=3), plan, goals)
+
+async def build_summary_jsons(first_month: str, last_month: str) -> Dict[str, Dict[str, Any]]:
+    """Summary data for every month in the range, with one fetch of each collection."""
+    aggregates, budgets, goals = await asyncio.gather(
+        get_monthly_aggregates(),
+        load_budgets(),
+        gather_goal_progress(first_month),
+    )
+    months = []
+    month = datetime.strptime(first_month + "-01", "%Y-%m-%d")
+    while _month_str(month) <= last_month:
+        months.append(_month_str(month))
+        month = (month + timedelta(days=32)).replace(day=1)
+    return {
+        month: summary_from_stats(month, aggregates.month_summary(month, top_k=3), budget_for_month(budgets, month), goals)
+        for month in months
+    }
+
+def summary_from_stats(month: str, stats: Dict[str, Any], plan: Dict[str, float], goals: List[Dict]) -> Dict[str, Any]:
+    actual = stats["totals"]
     deltas = budget_vs_actual(actual, plan)
 
-    print("txns", txns)
-    print("plan", plan)
-    
-    prev_month = _month_str(datetime.strptime(month+"-01", "%Y-%m-%d") - timedelta(days=1))
-    prev_txns  = get_transactions(prev_month)
-    trend_tot  = round(sum(t["Amount"] for t in txns) - sum(t["Amount"] for t in prev_txns), 2)
-    prev_actual = total_by_category(prev_txns)
+    trend_tot  = stats["net_change"]
+    prev_actual = stats["previous_totals"]
     category_trends = {}
     all_categories = set(actual.keys()) | set(prev_actual.keys()) # Union of all categories from both months
 
@@ -68,7 +90,6 @@ def build_summary_json(month: str) -> Dict[str, Any]:
             "change_amount": round(change, 2),
             "percent_change": percent_change_str
         }
-    goals = gather_goal_progress(month)
 
     # Add top transactions for key categories
     top_transactions_details: Dict[str, List[Dict[str, Any]]] = {}
@@ -79,19 +100,14 @@ def build_summary_json(month: str) -> Dict[str, Any]:
         if spending_actual: # if there are any spending categories left
             most_spent_category = max(spending_actual, key=lambda k: abs(spending_actual[k]))
 
-            # Get top 3 transactions for the most spent category
-            # Ensure transactions have 'Description' and 'Amount', handle missing keys
-            most_spent_txns_for_category = sorted(
-                [t for t in txns if t.get("Category") == most_spent_category and t.get("Amount") is not None],
-                key=lambda x: abs(float(x["Amount"])), # Assuming amount can be negative for credits, use abs if only magnitude matters
-                reverse=True # Largest amounts first
-            )[:3]
+            # Top 3 transactions (by absolute amount) for the most spent category
+            most_spent_txns_for_category = stats["top_transactions"].get(most_spent_category, [])
 
             transactions_to_display = []
             for t in most_spent_txns_for_category:
-                description_text = t.get("Seller", "N/A") # Use Seller first
-                if description_text == "N/A" and "Subcategory" in t: # Fallback to Subcategory if Seller is N/A
-                    description_text = t.get("Subcategory")
+                description_text = t["Seller"] or "N/A" # Use Seller first
+                if description_text == "N/A" and t["Subcategory"]: # Fallback to Subcategory if Seller is N/A
+                    description_text = t["Subcategory"]
                 
                 transactions_to_display.append({
                     "Source": description_text, # Changed key from "Description" to "Source"
@@ -142,8 +158,62 @@ async def generate_monthly_summary(month: str):
     try:
         # default month = previous full month
         month = month or _month_str(CURRENT_DATE.replace(day=1) - timedelta(days=1))
-        summary_data = build_summary_json(month)
+        summary_data = await build_summary_json(month)
+    except Exception as e:
+        raise HTTPException(500, detail=f"Summary error: {e}")
 
+    return await explain_summary(month, summary_data)
+
+async def generate_monthly_summaries(first_month: str, last_month: str):
+    """
+    Build the summary data for a month range up front, then return an async generator that
+    yields each month's result as soon as its LLM narrative is ready.
+    """
+    try:
+        first, last = datetime.strptime(first_month, "%Y-%m"), datetime.strptime(last_month, "%Y-%m")
+        if first > last:
+            raise ValueError("start_month must not be after end_month")
+        if (last.year - first.year) * 12 + last.month - first.month >= SUMMARY_BATCH_MAX_MONTHS:
+            raise ValueError(f"at most {SUMMARY_BATCH_MAX_MONTHS} months per batch")
+    except ValueError as e:
+        raise HTTPException(400, detail=f"Invalid month range: {e}")
+
+    try:
+        all_summary_data = await build_summary_jsons(first_month, last_month)
+    except Exception as e:
+        raise HTTPException(500, detail=f"Summary error: {e}")
+
+    return _explain_summaries(all_summary_data)
+
+async def _explain_summaries(all_summary_data: Dict[str, Dict[str, Any]]):
+    semaphore = asyncio.Semaphore(SUMMARY_BATCH_CONCURRENCY)
+
+    async def explain(month: str, summary_data: Dict[str, Any]):
+        async with semaphore:
+            try:
+                return {"month": month, **await explain_summary(month, summary_data)}
+            except HTTPException as e:
+                return {"month": month, "error": e.detail}
+
+    tasks = [asyncio.ensure_future(explain(month, data)) for month, data in all_summary_data.items()]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # The client went away before every month was done
+        for task in tasks:
+            task.cancel()
+
+async def explain_summary(month: str, summary_data: Dict[str, Any]):
+    """Ask the LLM for the narrative of one month's summary data and store the result."""
+    # Identical data, prompt and model give the same answer, so skip the LLM on a hit
+    cache_key = summary_cache_key(summary_data, SUMMARY_PROMPT_VERSION, DEFAULT_MODEL)
+    cached = summary_cache.get(cache_key)
+    record_cache("summary", cached is not None)
+    if cached is not None:
+        return cached
+
+    try:
         most_spent_cat_name = summary_data.get("most_spent_category_excluding_income", "N/A")
 
         top_transactions_for_prompt = []
@@ -223,7 +293,7 @@ Do not analyze income as an expense.
 
 
 # ----- call LLM ------------------------------------------------------
-        resp = get_llm_response(prompt)
+        resp = await get_llm_response(prompt, agent="summary")
         raw = resp.text
 
         # split explanation + JSON
@@ -235,9 +305,11 @@ Do not analyze income as an expense.
             raise ValueError("Parsing LLM output failed") from e
 
         # store summary back to DB
-        save_summary(month, parsed)
+        await save_summary(month, parsed)
 
-        return {"explanation": expl.strip(), "summary": parsed}
+        result = {"explanation": expl.strip(), "summary": parsed}
+        summary_cache.put(cache_key, month, result)
+        return result
 
     except Exception as e:
         raise HTTPException(500, detail=f"Summary error: {e}")
\ No newline at end of file
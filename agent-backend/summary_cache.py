@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Config
+SUMMARY_CACHE = os.getenv("SUMMARY_CACHE", "memory")  # memory | sqlite | off
+SUMMARY_CACHE_DB_PATH = os.getenv("SUMMARY_CACHE_DB_PATH", "summary_cache.db")
+# Entries kept by the in-memory cache before the least recently used one is evicted.
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "500"))
+
+
+def summary_cache_key(summary_data: Dict[str, Any], prompt_version: str, model: str) -> str:
+    """Hash of everything the LLM output depends on: the data, the prompt template and the model."""
+    payload = json.dumps(summary_data, sort_keys=True) + "\n" + prompt_version + "\n" + model
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def months_affected_by(transaction_months: Iterable[str]) -> set:
+    """A month's summary compares against the previous month, so a change also touches the next one."""
+    affected = set()
+    for month in transaction_months:
+        affected.add(month)
+        next_month = (datetime.strptime(month + "-01", "%Y-%m-%d") + timedelta(days=31)).strftime("%Y-%m")
+        affected.add(next_month)
+    return affected
+
+
+class SummaryCache:
+    """LLM output for monthly summaries, keyed by summary_cache_key and grouped by month."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put(self, key: str, month: str, value: Dict[str, Any]):
+        raise NotImplementedError
+
+    def invalidate_month(self, month: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class NoSummaryCache(SummaryCache):
+    def get(self, key):
+        return None
+
+    def put(self, key, month, value):
+        pass
+
+    def invalidate_month(self, month):
+        pass
+
+    def clear(self):
+        pass
+
+
+class InMemorySummaryCache(SummaryCache):
+    def __init__(self, max_entries: int = SUMMARY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, month, value):
+        self._entries[key] = (month, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_month(self, month):
+        for key in [k for k, (m, _) in self._entries.items() if m == month]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+
+class SQLiteSummaryCache(SummaryCache):
+    def __init__(self, path: str = SUMMARY_CACHE_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                key TEXT PRIMARY KEY,
+                month TEXT NOT NULL,
+                value TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summary_cache_month ON summary_cache(month)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM summary_cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, month, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summary_cache (key, month, value) VALUES (?, ?, ?)",
+                (key, month, json.dumps(value)),
+            )
+
+    def invalidate_month(self, month):
+        with self._lock:
+            self._conn.execute("DELETE FROM summary_cache WHERE month = ?", (month,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM summary_cache")
+
+
+def create_summary_cache() -> SummaryCache:
+    """Build the cache selected by the SUMMARY_CACHE env variable."""
+    if SUMMARY_CACHE == "memory":
+        return InMemorySummaryCache()
+    if SUMMARY_CACHE == "sqlite":
+        return SQLiteSummaryCache()
+    if SUMMARY_CACHE == "off":
+        return NoSummaryCache()
+    raise ValueError(f"Unknown SUMMARY_CACHE: {SUMMARY_CACHE}")
+
+
+summary_cache = create_summary_cache()
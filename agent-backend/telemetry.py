@@ -0,0 +1,108 @@
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+from dotenv import load_dotenv
+from prometheus_client import Counter, Histogram
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Config
+# OTLP/HTTP collector to export spans to, e.g. http://localhost:4318. Tracing is off when unset.
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "budgy-agent-backend")
+
+# Metrics, served in the Prometheus text format at /metrics
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response starts, per route.",
+    ["method", "route", "status"],
+)
+LLM_LATENCY = Histogram(
+    "llm_call_duration_seconds",
+    "Gemini call latency including retries.",
+    ["agent", "model", "outcome"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by Gemini.", ["agent", "model", "kind"])
+TOOL_LATENCY = Histogram("tool_call_duration_seconds", "Agent tool latency.", ["tool_name", "outcome"])
+JSON_SERVER_LATENCY = Histogram(
+    "json_server_request_duration_seconds",
+    "Round trips to the JSON server.",
+    ["method", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by result (hit or miss).", ["cache", "result"])
+AGENT_TURNS = Counter("agent_turns_total", "Finished agent turns by how they ended.", ["agent", "outcome"])
+
+_tracer = None
+
+
+def setup_tracing():
+    """Export spans to OTEL_EXPORTER_OTLP_ENDPOINT if it is set and the OpenTelemetry SDK is installed."""
+    global _tracer
+    if not OTEL_EXPORTER_OTLP_ENDPOINT or _tracer is not None:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        print("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http are not installed; tracing is off.")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=OTEL_EXPORTER_OTLP_ENDPOINT.rstrip("/") + "/v1/traces")))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("budgy")
+
+
+def shutdown_tracing():
+    """Flush the spans still waiting to be exported."""
+    if _tracer is not None:
+        from opentelemetry import trace
+        trace.get_tracer_provider().shutdown()
+
+
+def span(name: str, **attributes):
+    """A tracing span around a block, or nothing when tracing is off."""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes={k: v for k, v in attributes.items() if v is not None})
+
+
+def record_span(name: str, seconds: float, error: bool = False, **attributes):
+    """A span for work that already finished `seconds` ago, e.g. a streamed LLM call."""
+    if _tracer is None:
+        return
+    from opentelemetry.trace import Status, StatusCode
+    end = time.time_ns()
+    finished = _tracer.start_span(
+        name,
+        start_time=end - int(seconds * 1e9),
+        attributes={k: v for k, v in attributes.items() if v is not None},
+    )
+    if error:
+        finished.set_status(Status(StatusCode.ERROR))
+    finished.end(end_time=end)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """Observe the block's duration on histogram. Sets labels["outcome"] to "error" if it raises."""
+    start = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        if "outcome" in labels:
+            labels["outcome"] = "error"
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
@@ -1,27 +1,28 @@
-from pydantic import BaseModel
-from dotenv import load_dotenv
-import os
-import requests
+from pydantic import BaseModel, Field
+import asyncio
 import json
+import re
 from fastapi import HTTPException
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional, Type, Union
 from datetime import datetime
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Config
-JSON_SERVER_URL = os.getenv("JSON_SERVER_URL")
-if not JSON_SERVER_URL:
-    raise ValueError("JSON_SERVER_URL is not set in the .env file")
+from storage import storage, StorageError, STORAGE_PAGE_SIZE
+from context_builder import compact_tool_result
+from transaction_store import TransactionRepository
+from transaction_columns import TransactionColumns
+from transaction_record import iso_day
+from monthly_aggregates import MonthlyAggregates
+from summary_cache import summary_cache, months_affected_by
+from telemetry import TOOL_LATENCY, record_cache, span, timed
+from single_flight import SingleFlight
 
 tool_definitions = [
     {
         "tool_name": "get_transactions_in_range",
-        "description": "Fetches transactions for a user for a given time period.",
+        "description": "Fetches transactions for a user for a given time period, optionally only those of one category.",
         "parameters": {
             "start_date": "string (YYYY-MM-DD)", 
             "end_date": "string (YYYY-MM-DD)",
+            "category": "string (optional)",
         },
         "expected_output": {
             "transactions": [
@@ -36,6 +37,49 @@ tool_definitions = [
             "total_count": "integer"
         }
     },
+    {
+        "tool_name": "get_spending_snapshot",
+        "description": "Returns aggregates of the user's transactions for a given time period instead of the raw rows: income and spending totals, per-category monthly totals with their monthly average and standard deviation, per-subcategory totals, the sellers with the most spending and recurring charges. Spending amounts are negative. Prefer this tool over get_transactions_in_range unless individual transactions are needed.",
+        "parameters": {
+            "start_date": "string (YYYY-MM-DD)",
+            "end_date": "string (YYYY-MM-DD)",
+        },
+        "expected_output": {
+            "months": ["string (YYYY-MM)"],
+            "transaction_count": "integer",
+            "total_income": "float",
+            "total_spending": "float",
+            "net": "float",
+            "categories": {
+                "<Category>": {
+                    "total": "float",
+                    "monthly_totals": {"<YYYY-MM>": "float"},
+                    "monthly_average": "float",
+                    "monthly_std": "float",
+                    "subcategories": {"<Subcategory>": "float"}
+                }
+            },
+            "top_sellers": [{"Seller": "string", "total": "float", "count": "integer"}],
+            "recurring_charges": [{"Seller": "string", "Amount": "float", "months": "integer"}]
+        }
+    },
+    {
+        "tool_name": "get_budget_vs_actual",
+        "description": "Compares the saved budget of a month with what was actually spent, per category: the budgeted amount, the actual total (spending is negative), how much of the budget is left, and the number, smallest and largest of the transactions. Cheap to call, also for months with many transactions.",
+        "parameters": {
+            "Month": "string (YYYY-MM)",
+        },
+        "expected_output": {
+            "<Category>": {
+                "budget": "float or null",
+                "actual": "float",
+                "remaining": "float or null",
+                "count": "integer",
+                "min": "float",
+                "max": "float"
+            }
+        }
+    },
     {
         "tool_name": "get_goals",
         "description": "Retrieves a list of already saved financial goals of the user.",
@@ -69,7 +113,7 @@ tool_definitions = [
     },
     {
         "tool_name": "save_budget",
-        "description": "Saves the entire financial budget for a month for a user. Accepts a month and a list of budget items (category and amount). Each item will be saved as a separate row in the database. Make sure you give the parameters in the correct JSON format. Make sure the tool call is a single JSON object (not a stringified or escaped object).",
+        "description": "Saves the entire financial budget for a month for a user. Accepts a month and a list of budget items (category and amount). Each item will be saved as a separate row in the database; an existing row for the same month and category is updated with the new amount. Make sure you give the parameters in the correct JSON format. Make sure the tool call is a single JSON object (not a stringified or escaped object).",
         "parameters": {
             "Month": "string (YYYY-MM)",
             "Items": [
@@ -84,7 +128,8 @@ tool_definitions = [
                 "Month": "string (YYYY-MM)",
                 "Category": "string",
                 "Amount": "float",
-                "id": "string"
+                "id": "string",
+                "status": "string (created | updated | unchanged | error)"
             }
         ]
     },
@@ -100,68 +145,365 @@ tool_definitions = [
     }
 ]
 
-async def handle_tool_usage(response: str):
-    try:
-        # Parse the tool name and parameters from the response
-        response_parts = response.split("USE_TOOL:::", 1)
-        if len(response_parts) != 2:
-            raise ValueError("Invalid tool usage response format")
-        tool_name_and_params = response_parts[1]
-        tool_name, parameters = tool_name_and_params.split(":::", 1)
-        parameters = json.loads(parameters)  # Convert parameters from JSON string to dictionary
-
-        # Dynamically call the corresponding tool function
-        if tool_name == "save_goal":
-            validated_params = SaveGoalParams(**parameters)
-            result = save_goal(validated_params)  # Call the save_goal function with validated parameters
-        elif tool_name == "get_goals":
-            result = get_goals()
-        elif tool_name == "delete_goal":
-            validated_params = DeleteGoalParams(**parameters)  # Validate parameters using Pydantic
-            result = delete_goal(validated_params)  # Call the delete_goal function with validated parameters
-        elif tool_name == "get_transactions_in_range":
-            result = get_transactions_in_range(parameters)
-        elif tool_name == "save_budget":
-            result = save_budget(parameters)
-        else:
+TOOL_NAMES = {tool["tool_name"] for tool in tool_definitions}
+# Tools without side effects; these may run concurrently and be prefetched
+READ_ONLY_TOOLS = {"get_goals", "get_transactions_in_range", "get_spending_snapshot", "get_budget_vs_actual"}
+
+# Text tool calls, used when the model writes a call instead of using function calling:
+# USE_TOOL:::name:::{json} or USE_TOOLS:::[{"tool_name": ..., "parameters": {...}}, ...]
+_TOOL_CALL_PATTERN = re.compile(r"USE_TOOL:::\s*(\w+)\s*:::\s*")
+_TOOL_CALLS_PATTERN = re.compile(r"USE_TOOLS:::\s*")
+_json_decoder = json.JSONDecoder()
+
+def parse_tool_calls(response: str) -> List[tuple]:
+    """(tool_name, parameters) pairs from a USE_TOOL::: or USE_TOOLS::: response."""
+    match = _TOOL_CALLS_PATTERN.search(response)
+    if match:
+        # raw_decode ignores any text after the JSON
+        calls, _ = _json_decoder.raw_decode(response, match.end())
+        if not isinstance(calls, list) or not calls:
+            raise ValueError("USE_TOOLS::: must be followed by a non-empty JSON list")
+        return [(call["tool_name"], call.get("parameters") or {}) for call in calls]
+
+    match = _TOOL_CALL_PATTERN.search(response)
+    if not match:
+        raise ValueError("Invalid tool usage response format")
+    parameters, _ = _json_decoder.raw_decode(response, match.end())
+    return [(match.group(1), parameters or {})]
+
+def _call_key(tool_name: str, parameters) -> str:
+    return tool_name + ":" + json.dumps(parameters, sort_keys=True)
+
+async def run_tool(tool_name: str, parameters):
+    if tool_name not in TOOL_NAMES:
+        raise ValueError(f"Unknown tool: {tool_name}")
+    with span("tool", tool_name=tool_name), timed(TOOL_LATENCY, tool_name=tool_name, outcome="ok"):
+        return await _run_tool(tool_name, parameters)
+
+async def _run_tool(tool_name: str, parameters):
+    # Validate parameters using Pydantic, for function calls and text calls alike
+    params_model = TOOL_PARAMS[tool_name]
+    validated_params = params_model(**(parameters or {})) if params_model else None
+
+    # Dynamically call the corresponding tool function
+    if tool_name == "save_goal":
+        return await save_goal(validated_params)
+    elif tool_name == "get_goals":
+        return await get_goals()
+    elif tool_name == "delete_goal":
+        return await delete_goal(validated_params)
+    elif tool_name == "get_transactions_in_range":
+        return await get_transactions_in_range(validated_params.dict())
+    elif tool_name == "get_spending_snapshot":
+        return await get_spending_snapshot(validated_params.dict())
+    elif tool_name == "save_budget":
+        return await save_budget(validated_params.dict())
+    elif tool_name == "get_budget_vs_actual":
+        return await get_budget_vs_actual(validated_params.dict())
+
+def start_prefetch(calls: List[tuple]) -> Dict[str, asyncio.Task]:
+    """
+    Start read-only tool calls the agent is likely to ask for, e.g. while its first LLM call
+    is in flight. Pass the result to handle_tool_usage; cancel_prefetch when the turn ends.
+    """
+    return {
+        _call_key(tool_name, parameters): asyncio.ensure_future(run_tool(tool_name, parameters))
+        for tool_name, parameters in calls
+        if tool_name in READ_ONLY_TOOLS
+    }
+
+def cancel_prefetch(prefetched: Optional[Dict[str, asyncio.Task]]):
+    for task in (prefetched or {}).values():
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()  # mark a failed, unused prefetch as retrieved
+
+async def _run_or_reuse(tool_name: str, parameters, prefetched: Optional[Dict[str, asyncio.Task]]):
+    task = prefetched.pop(_call_key(tool_name, parameters), None) if prefetched else None
+    if prefetched is not None:
+        record_cache("tool_prefetch", task is not None)
+    if task is not None:
+        return await task
+    return await run_tool(tool_name, parameters)
+
+def _format_tool_result(tool_name: str, result) -> str:
+    # Return the result of the tool execution
+    # Large payloads are reduced to aggregates before they reach the prompt
+    return f"Tool '{tool_name}' executed successfully. Result: {json.dumps(compact_tool_result(tool_name, result))}"
+
+def _money(amount: float) -> str:
+    return f"${abs(amount):,.2f}"
+
+def _describe_goals(goals):
+    if not goals:
+        return "You have no saved goals."
+    return "Your saved goals: " + "; ".join(
+        f"{g['goal_name']} ({_money(g['target_amount'])} by {g['due_date']})" for g in goals
+    ) + "."
+
+def _describe_transactions(result):
+    spent = sum(t["Amount"] for t in result["transactions"] if t["Amount"] < 0)
+    return f"{result['total_count']} transactions in that period, {_money(spent)} spent in total."
+
+def _describe_snapshot(snapshot):
+    line = (
+        f"From {snapshot['start_date']} to {snapshot['end_date']}: {_money(snapshot['total_income'])} income "
+        f"and {_money(snapshot['total_spending'])} spending."
+    )
+    # Categories are ordered from the most spent
+    largest = [f"{name} ({_money(c['total'])})" for name, c in snapshot["categories"].items() if c["total"] < 0][:3]
+    return line + (f" Largest spending: {', '.join(largest)}." if largest else "")
+
+def _describe_budget_vs_actual(comparison):
+    parts = [
+        f"{category} {_money(c['actual'])} of {_money(c['budget'])}"
+        for category, c in comparison.items() if c["budget"] is not None and c["actual"] <= 0
+    ]
+    return f"Spent against the budget: {'; '.join(parts)}." if parts else "There is no budget saved for that month."
+
+def _describe_saved_budget(rows):
+    saved = [row for row in rows if row.get("status") != "error"]
+    return f"Saved the budget for {rows[0]['Month']} ({len(saved)} {'category' if len(saved) == 1 else 'categories'})." if rows else None
+
+# One plain-language line per tool result, for answers the agent could not finish itself
+_RESULT_DIGESTS = {
+    "get_goals": _describe_goals,
+    "get_transactions_in_range": _describe_transactions,
+    "get_spending_snapshot": _describe_snapshot,
+    "get_budget_vs_actual": _describe_budget_vs_actual,
+    "save_goal": lambda goal: f"Saved the goal \"{goal['goal_name']}\".",
+    "save_budget": _describe_saved_budget,
+    "delete_goal": lambda _: "Deleted the goal.",
+}
+
+def describe_tool_results(results: List[tuple]) -> str:
+    """A short digest of (tool_name, result) pairs for the user, without ids or raw JSON."""
+    lines = []
+    for tool_name, result in results:
+        try:
+            line = _RESULT_DIGESTS[tool_name](result)
+        except Exception:
+            # A result of an unexpected shape is left out rather than shown raw
+            continue
+        if line:
+            lines.append(f"- {line}")
+    return "\n".join(lines)
+
+async def handle_tool_usage(
+    calls: Union[List[tuple], str],
+    prefetched: Optional[Dict[str, asyncio.Task]] = None,
+    results_out: Optional[List[tuple]] = None,
+):
+    """
+    Run the tool calls of an agent reply: (tool_name, parameters) pairs from function calling,
+    or the reply text, parsed as USE_TOOL::: / USE_TOOLS:::. Read-only tools requested together
+    run concurrently; tools with side effects run afterwards, in order. With results_out, the
+    (tool_name, result) pairs of the calls that succeeded are appended to it.
+    """
+    if results_out is None:
+        results_out = []
+    if isinstance(calls, str):
+        try:
+            calls = parse_tool_calls(calls)
+        except Exception as e:
+            return f"An error occurred while using the tool: {str(e)}"
+
+    if len(calls) == 1:
+        tool_name, parameters = calls[0]
+        if tool_name not in TOOL_NAMES:
             return f"Unknown tool: {tool_name}"
+        try:
+            if tool_name not in READ_ONLY_TOOLS and prefetched:
+                cancel_prefetch(prefetched)  # data may change, prefetched reads would be stale
+                prefetched.clear()
+            result = await _run_or_reuse(tool_name, parameters, prefetched)
+            results_out.append((tool_name, result))
+            return _format_tool_result(tool_name, result)
+        except Exception as e:
+            return f"An error occurred while using the tool: {str(e)}"
+
+    reads = [(i, call) for i, call in enumerate(calls) if call[0] in READ_ONLY_TOOLS]
+    writes = [(i, call) for i, call in enumerate(calls) if call[0] not in READ_ONLY_TOOLS]
+    results = [None] * len(calls)
+    outcomes = await asyncio.gather(
+        *(_run_or_reuse(name, params, prefetched) for _, (name, params) in reads),
+        return_exceptions=True,
+    )
+    for (i, _), outcome in zip(reads, outcomes):
+        results[i] = outcome
+    if writes and prefetched:
+        cancel_prefetch(prefetched)
+        prefetched.clear()
+    for i, (name, params) in writes:
+        try:
+            results[i] = await run_tool(name, params)
+        except Exception as e:
+            results[i] = e
+
+    lines = []
+    for (tool_name, _), result in zip(calls, results):
+        if isinstance(result, Exception):
+            lines.append(f"Tool '{tool_name}' failed: {str(result)}")
+        else:
+            results_out.append((tool_name, result))
+            lines.append(_format_tool_result(tool_name, result))
+    return "\n".join(lines)
 
-        # Return the result of the tool execution
-        return f"Tool '{tool_name}' executed successfully. Result: {json.dumps(result)}"
-        
-    except Exception as e:
-        return f"An error occurred while using the tool: {str(e)}"
     # Tool functions
 
+# Full-collection reads made at the same time share one storage request; writes invalidate them
+collection_reads = SingleFlight("storage_reads")
+
+async def _list_collection(name: str) -> List[Dict]:
+    # A copy of the shared list, so a caller can't change what the others see
+    return list(await collection_reads.do(name, lambda: storage.list(name)))
+
     # Load Transactions
-def load_transactions():
+async def load_transactions():
     try:
-        # Call the FastAPI endpoint
-        response = requests.get(JSON_SERVER_URL + "/transactions")
-        response.raise_for_status()  # Raise an error for HTTP errors
-        return response.json()  # Return the JSON response as a Python list
-    except requests.exceptions.RequestException as e:
+        # Read the collection from the storage backend
+        return await _list_collection("transactions")
+    except StorageError as e:
         print(f"Error fetching transactions: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch transactions from the /transactions endpoint.")
 
-def get_transactions(month: str):
-    """Return all txns for the yyyy-mm period."""
-    try:
-        # Load all transactions
-        transactions = load_transactions()
+# Indexed copy of /transactions used by the month and range queries
+transactions_repo = TransactionRepository(load_transactions)
 
-        # Filter transactions by the given date range
-        filtered_transactions = [
-        t for t in transactions
-        if t["Date"].startswith(month)
-        ]
+def _invalidate_summaries(months):
+    for month in months_affected_by(months):
+        summary_cache.invalidate_month(month)
+
+transactions_repo.subscribe(_invalidate_summaries)
+
+# Per-month category totals, kept current from the repository's row changes
+monthly_aggregates = MonthlyAggregates(transactions_repo)
+
+_columns: Optional[TransactionColumns] = None
+_columns_version = -1
 
-        return filtered_transactions
+async def get_transaction_columns() -> TransactionColumns:
+    """Columnar view of all transactions, rebuilt only when the repository changed."""
+    global _columns, _columns_version
+    try:
+        await transactions_repo.ensure_fresh()
+        stale = _columns is None or _columns_version != transactions_repo.version
+        record_cache("transaction_columns", not stale)
+        if stale:
+            _columns = TransactionColumns(transactions_repo.all())
+            _columns_version = transactions_repo.version
+        return _columns
+    except Exception as e:
+        print(f"Error processing transactions: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process transactions.")
+
+async def get_monthly_aggregates() -> MonthlyAggregates:
+    try:
+        await transactions_repo.ensure_fresh()
+        return monthly_aggregates
     except Exception as e:
         print(f"Error processing transactions: {e}")
         raise HTTPException(status_code=500, detail="Failed to process transactions.")
 
-def get_transactions_in_range(params: dict):
+class TransactionParams(BaseModel):
+    Date: str = Field(description="YYYY-MM-DD")
+    Category: str
+    Subcategory: Optional[str] = None
+    Amount: float
+    Seller: Optional[str] = None
+
+def _validate_transaction(params: TransactionParams) -> Dict:
+    try:
+        # Stored zero-padded, so range filters comparing the strings find it
+        day = iso_day(params.Date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Date must be YYYY-MM-DD.")
+    return {**params.dict(), "Date": day}
+
+async def _stored_transaction(transaction_id: str) -> Dict:
+    # Seeded ids are not unique; like the storage backends, act on the first row with the id
+    try:
+        rows = await storage.list("transactions", {"id": transaction_id})
+    except StorageError as e:
+        print(f"Error fetching transaction {transaction_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch the transaction.")
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"No transaction with id {transaction_id}.")
+    return rows[0]
+
+async def add_transaction(params: TransactionParams) -> Dict:
+    """Store a new transaction and add it to the in-process indexes and aggregates."""
+    row = _validate_transaction(params)
+    try:
+        saved = await storage.create("transactions", row)
+    except StorageError as e:
+        print(f"Error saving transaction: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save the transaction.")
+    finally:
+        collection_reads.invalidate("transactions")
+    transactions_repo.apply_write(added=[saved])
+    return saved
+
+async def update_transaction(transaction_id: str, params: TransactionParams) -> Dict:
+    """Replace a stored transaction, moving it between months and categories as needed."""
+    row = _validate_transaction(params)
+    previous = await _stored_transaction(transaction_id)
+    try:
+        saved = await storage.update("transactions", transaction_id, row)
+    except StorageError as e:
+        print(f"Error updating transaction {transaction_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update the transaction.")
+    finally:
+        collection_reads.invalidate("transactions")
+    transactions_repo.apply_write(added=[saved], removed=[previous])
+    return saved
+
+async def delete_transaction(transaction_id: str) -> Dict:
+    previous = await _stored_transaction(transaction_id)
+    try:
+        await storage.delete("transactions", transaction_id)
+    except StorageError as e:
+        print(f"Error deleting transaction {transaction_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete the transaction.")
+    finally:
+        collection_reads.invalidate("transactions")
+    transactions_repo.apply_write(removed=[previous])
+    return previous
+
+async def transaction_pages(
+    start_date: str, end_date: str, category: Optional[str] = None, page_size: int = STORAGE_PAGE_SIZE
+) -> AsyncIterator[List[Dict]]:
+    """
+    Transactions between two YYYY-MM-DD dates (inclusive), optionally of one category, in
+    date order and page_size rows at a time. The filters run in the storage backend (the date
+    range is checked page by page on json-server), so only the requested window is held in
+    memory.
+    """
+    filters = {"Date_gte": start_date, "Date_lte": end_date}
+    if category is not None:
+        filters["Category"] = category
+    try:
+        async for page in storage.pages("transactions", filters, sort="Date", page_size=page_size):
+            yield page
+    except StorageError as e:
+        print(f"Error fetching transactions: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch transactions from the /transactions endpoint.")
+
+async def _transactions_between(start_date: str, end_date: str, category: Optional[str] = None) -> List[Dict]:
+    # Served from the in-process index. A stale index is reloaded first: one request for the
+    # collection, where json-server would otherwise be paged through up to the window.
+    await transactions_repo.ensure_fresh()
+    return [t.to_row() for t in transactions_repo.in_range(start_date, end_date, category)]
+
+class DateRangeParams(BaseModel):
+    start_date: str = Field(description="YYYY-MM-DD")
+    end_date: str = Field(description="YYYY-MM-DD")
+
+class TransactionRangeParams(DateRangeParams):
+    category: Optional[str] = Field(default=None, description="Only transactions of this category")
+
+async def get_transactions_in_range(params: dict):
     """Return all transactions for the given date range (inclusive)."""
     try:
         start_date = params.get("start_date")
@@ -169,171 +511,243 @@ def get_transactions_in_range(params: dict):
         if not start_date or not end_date:
             raise ValueError("Both start_date and end_date must be provided.")
 
-        # Parse dates
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-
-        # Load all transactions
-        transactions = load_transactions()
+        # Validate the dates; the index compares the ISO strings directly
+        datetime.strptime(start_date, "%Y-%m-%d")
+        datetime.strptime(end_date, "%Y-%m-%d")
 
-        # Filter transactions by the given date range (inclusive)
-        filtered_transactions = [
-            t for t in transactions
-            if start_dt <= datetime.strptime(t["Date"], "%Y-%m-%d") <= end_dt
-        ]
+        filtered_transactions = await _transactions_between(start_date, end_date, params.get("category"))
 
         return {
             "transactions": filtered_transactions,
             "total_count": len(filtered_transactions)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing transactions: {e}")
         raise HTTPException(status_code=500, detail="Failed to process transactions.")
 
-def get_goals():
+async def get_spending_snapshot(params: dict):
+    """Aggregates of the transactions in the given date range (inclusive), computed from the columnar index."""
     try:
-        # Call the FastAPI endpoint
-        response = requests.get(JSON_SERVER_URL + "/goals")
-        response.raise_for_status()  # Raise an error for HTTP errors
-        return response.json()  # Return the JSON response as a Python list
-    except requests.exceptions.RequestException as e:
+        start_date = params.get("start_date")
+        end_date = params.get("end_date")
+        if not start_date or not end_date:
+            raise ValueError("Both start_date and end_date must be provided.")
+        if datetime.strptime(start_date, "%Y-%m-%d") > datetime.strptime(end_date, "%Y-%m-%d"):
+            raise ValueError("start_date must not be after end_date.")
+
+        columns = await get_transaction_columns()
+        return columns.snapshot(start_date, end_date)
+    except Exception as e:
+        print(f"Error processing transactions: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process transactions.")
+
+async def get_goals():
+    try:
+        # Read the collection from the storage backend
+        return await _list_collection("goals")
+    except StorageError as e:
         print(f"Error fetching goals: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch goals from the /goals endpoint.")
 
 class DeleteGoalParams(BaseModel):
     id: str
-def delete_goal(params: DeleteGoalParams):
+async def delete_goal(params: DeleteGoalParams):
     try:
-        # Send a DELETE request to the /goals endpoint with the goal_id
-        response = requests.delete(
-            JSON_SERVER_URL + f"/goals/{params.id}",
-        )
-        response.raise_for_status()  # Raise an error for HTTP errors
+        # Delete the goal by its id
+        await storage.delete("goals", params.id)
+        summary_cache.clear()  # goal progress is part of every month's summary
 
         return params.dict()  # Return a success message
-    except requests.exceptions.RequestException as e:
+    except StorageError as e:
         print(f"Error deleting goal: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete the goal from the /goals endpoint.")
+    finally:
+        collection_reads.invalidate("goals")
 
 
 class SaveGoalParams(BaseModel):
     goal_name: str
     target_amount: float
     monthly_amount: float
-    due_date: str
+    due_date: str = Field(description="YYYY-MM-DD")
 
-def save_goal(params: SaveGoalParams):
+async def save_goal(params: SaveGoalParams):
     try:
-        # Send the goal to the /goals endpoint
-        response = requests.post(
-            JSON_SERVER_URL + "/goals",
-            json=params.dict()  # Convert Pydantic model to dictionary
-        )
-        response.raise_for_status()  # Raise an error for HTTP errors
-
-        return response.json()  # Return the response from the server
-    except requests.exceptions.RequestException as e:
+        # Store the goal
+        saved = await storage.create("goals", params.dict())  # Convert Pydantic model to dictionary
+        summary_cache.clear()  # goal progress is part of every month's summary
+
+        return saved  # Return the stored goal, with its id
+    except StorageError as e:
         print(f"Error saving goal: {e}")
         raise HTTPException(status_code=500, detail="Failed to save the goal to the /goals endpoint.")
     except Exception as e:
         print(f"Validation or other error: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid parameters: {str(e)}")
+    finally:
+        collection_reads.invalidate("goals")
+
+class BudgetItem(BaseModel):
+    Category: str
+    Amount: float
 
 class SaveBudgetParams(BaseModel):
-    month: str  # Format: YYYY-MM
-    items: list
+    Month: str = Field(description="YYYY-MM")
+    Items: List[BudgetItem]
 
-def save_budget(params: dict):
+async def save_budget(params: dict):
     """
-    Saves the entire budget for a given month (multiple categories) into the JSON server database.
+    Saves the entire budget for a given month (multiple categories) into the storage backend.
+    Rows are upserted on (Month, Category) and written in parallel. Either every row is saved or,
+    if any write fails, the ones already written are rolled back.
     """
     try:
         month = params["Month"]
         items = params["Items"]
         if not isinstance(items, list):
             raise ValueError("Items must be a list of {Category, Amount} objects.")
-
-        # Fetch existing budgets
-        response = requests.get(JSON_SERVER_URL + "/budgets")
-        response.raise_for_status()
-        budgets = response.json()
-
-        results = []
-        for item in items:
-            category = item["Category"]
-            amount = item["Amount"]
-
-            # Check for duplicates
-            exists = any(
-                b.get("Month") == month and b.get("Category") == category
-                for b in budgets
-            )
-            if exists:
-                results.append({
-                    "Month": month,
-                    "Category": category,
-                    "Amount": amount,
-                    "error": "Already exists"
-                })
-                continue
-
-            # Save new budget row
-            post_response = requests.post(
-                JSON_SERVER_URL + "/budgets",
-                json={
-                    "Month": month,
-                    "Category": category,
-                    "Amount": amount
-                }
-            )
-            post_response.raise_for_status()
-            results.append(post_response.json())
-
-        return results
+        items = [(item["Category"], item["Amount"]) for item in items]
+
+        # Only this month's rows, indexed by category
+        existing = {}
+        for row in await storage.list("budgets", {"Month": month}):
+            existing.setdefault(row["Category"], row)
+    except StorageError as e:
+        print(f"Error fetching budgets for {month}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch the existing budget.")
     except Exception as e:
         print(f"Error saving budget: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid parameters: {str(e)}")
 
+    results = []
+    writes = []  # (result index, id to update or None to create, body, row to restore on rollback)
+    seen = set()
+    for category, amount in items:
+        row = {"Month": month, "Category": category, "Amount": amount}
+        if category in seen:
+            results.append({**row, "status": "error", "error": "Duplicate category in request"})
+            continue
+        seen.add(category)
+
+        current = existing.get(category)
+        if current is None:
+            writes.append((len(results), None, row, None))
+            results.append({**row, "status": "created"})
+        elif current["Amount"] == amount:
+            results.append({**current, "status": "unchanged"})
+        else:
+            writes.append((len(results), current["id"], row, current))
+            results.append({**row, "id": current["id"], "status": "updated"})
+
+    outcomes = await asyncio.gather(
+        *(
+            storage.create("budgets", body) if row_id is None else storage.update("budgets", row_id, body)
+            for _, row_id, body, _ in writes
+        ),
+        return_exceptions=True,
+    )
+    if writes:
+        collection_reads.invalidate("budgets")
+    failed = [o for o in outcomes if isinstance(o, Exception)]
+    if failed:
+        await _rollback_budget_writes(writes, outcomes)
+        print(f"Error saving budget for {month}: {failed[0]}")
+        raise HTTPException(status_code=500, detail=f"Failed to save the budget for {month}; no changes were kept.")
+
+    for (index, row_id, _, _), outcome in zip(writes, outcomes):
+        if row_id is None:
+            results[index] = {**outcome, "status": "created"}
+
+    summary_cache.invalidate_month(month)
+    return results
+
+async def _rollback_budget_writes(writes, outcomes):
+    """Undo the budget writes that succeeded: delete created rows and restore updated ones."""
+    undo = []
+    for (_, row_id, _, previous), outcome in zip(writes, outcomes):
+        if isinstance(outcome, Exception):
+            continue
+        if row_id is None:
+            undo.append(storage.delete("budgets", outcome["id"]))
+        else:
+            undo.append(storage.update("budgets", row_id, previous))
+    for outcome in await asyncio.gather(*undo, return_exceptions=True):
+        if isinstance(outcome, Exception):
+            print(f"Error rolling back budget write: {outcome}")
+    collection_reads.invalidate("budgets")
 
-def load_budgets():
+
+async def load_budgets():
     """Fetch all budgets already saved by your Budget Agent."""
     try:
-        # Call the FastAPI endpoint
-        response = requests.get(JSON_SERVER_URL + "/budgets")
-        response.raise_for_status()  # Raise an error for HTTP errors
-        return response.json()  # Return the JSON response as a Python list
-    except requests.exceptions.RequestException as e:
+        # Read the collection from the storage backend
+        return await _list_collection("budgets")
+    except StorageError as e:
         print(f"Error fetching budgets: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch budgets from the /budgets endpoint.")
 
-def get_budget(month: str) -> Dict[str, float]:
+def budget_for_month(budgets: List[Dict], month: str) -> Dict[str, float]:
+    """Pick one month's budget out of the loaded /budgets rows."""
+    # detect flat rows: they have a "Month" key
+    if budgets and "Month" in budgets[0]:
+        return {
+            row["Category"]: row["Amount"]
+            for row in budgets
+            if row["Month"] == month
+        }
+
+    # otherwise fall back to the nested structure
+    for b in budgets:
+        if b.get("month") == month:
+            return b.get("categories", {})
+    return {}
+
+async def get_budget(month: str) -> Dict[str, float]:
     """Budget already saved by your Budget Agent."""
     try:
         # Load all budgets
-        budgets = load_budgets()
-
-        # detect flat rows: they have a "Month" key
-        if budgets and "Month" in budgets[0]:
-            return {
-                row["Category"]: row["Amount"]
-                for row in budgets
-                if row["Month"] == month
-            }
-
-        # otherwise fall back to the nested structure
-        for b in budgets:
-            if b.get("month") == month:
-                return b.get("categories", {})
-        return {}
+        budgets = await load_budgets()
+        return budget_for_month(budgets, month)
     except Exception as e:
         print(f"Error processing budgets: {e}")
         raise HTTPException(status_code=500, detail="Failed to process budgets.")
 
 
 
-def gather_goal_progress(month: str) -> List[Dict]:
+class MonthParams(BaseModel):
+    Month: str = Field(description="YYYY-MM")
+
+async def get_budget_vs_actual(params: dict):
+    """Budget and actual spending per category of a month, from the monthly aggregates."""
+    month = params["Month"]
+    try:
+        datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Month must be YYYY-MM.")
+    aggregates, plan = await asyncio.gather(get_monthly_aggregates(), get_budget(month))
+    stats = aggregates.month_stats(month)
+
+    comparison = {}
+    for category in list(stats) + [c for c in plan if c not in stats]:
+        actual = stats.get(category, {"total": 0.0, "count": 0, "min": None, "max": None})
+        budget = plan.get(category)
+        comparison[category] = {
+            "budget": budget,
+            # Budgets are positive amounts, spending is negative
+            "actual": actual["total"],
+            "remaining": round(budget + actual["total"], 2) if budget is not None else None,
+            "count": actual["count"],
+            "min": actual["min"],
+            "max": actual["max"],
+        }
+    return comparison
+
+
+async def gather_goal_progress(month: str) -> List[Dict]:
     """Very naive: look at db.goals[*].saved field updated elsewhere."""
-    goals = get_goals()
+    goals = await get_goals()
     progress = []
     for g in goals:
         pct = round(100*g["monthly_amount"]/g["target_amount"], 1)
@@ -341,24 +755,44 @@ def gather_goal_progress(month: str) -> List[Dict]:
     return progress
 
 
-def save_summary(month: str, parsed: Dict):
+async def save_summary(month: str, parsed: Dict):
     summary = {"month": month, **parsed}
 
     try:
         # Check if a summary for the month already exists
-        response = requests.get(f"{JSON_SERVER_URL}/summaries")
-        response.raise_for_status()
-        existing = response.json()
+        existing = await storage.list("summaries", {"month": month})
 
         if existing:
             # Update the existing summary
             summary_id = existing[0]["id"]
-            put_response = requests.put(f"{JSON_SERVER_URL}/summaries/{summary_id}", json=summary)
-            put_response.raise_for_status()
+            await storage.update("summaries", summary_id, summary)
         else:
             # Create a new summary
-            post_response = requests.post(f"{JSON_SERVER_URL}/summaries", json=summary)
-            post_response.raise_for_status()
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error saving summary for {month}: {e}")
\ No newline at end of file
+            await storage.create("summaries", summary)
+
+    except StorageError as e:
+        print(f"Error saving summary for {month}: {e}")
+    finally:
+        collection_reads.invalidate("summaries")
+
+
+# Parameter model of every tool (None for tools without parameters)
+TOOL_PARAMS: Dict[str, Optional[Type[BaseModel]]] = {
+    "get_transactions_in_range": TransactionRangeParams,
+    "get_spending_snapshot": DateRangeParams,
+    "get_goals": None,
+    "save_goal": SaveGoalParams,
+    "save_budget": SaveBudgetParams,
+    "delete_goal": DeleteGoalParams,
+    "get_budget_vs_actual": MonthParams,
+}
+
+# Gemini function declarations, generated once from the parameter models
+tool_declarations = [
+    {
+        "name": tool["tool_name"],
+        "description": tool["description"],
+        **({"parameters_json_schema": TOOL_PARAMS[tool["tool_name"]].model_json_schema()} if TOOL_PARAMS[tool["tool_name"]] else {}),
+    }
+    for tool in tool_definitions
+]
@@ -0,0 +1,137 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from transaction_record import Transaction, day_of
+
+# Date ordinals count from 0001-01-01, NumPy day numbers from 1970-01-01
+_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def _intern(values: List[Optional[str]], vocabulary: Dict[str, int]) -> np.ndarray:
+    """Replace strings with int codes from `vocabulary` (extended in place). Missing values become -1."""
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        codes[i] = -1 if value is None else vocabulary.setdefault(value, len(vocabulary))
+    return codes
+
+
+class TransactionColumns:
+    """
+    Transactions held as parallel NumPy arrays sorted by date: dates as int days,
+    months as int month numbers, category/subcategory/seller as interned codes and
+    amounts as float64. Group-bys are done with bincount over the codes. Built from
+    Transaction records, whose dates and amounts are already parsed.
+    """
+
+    def __init__(self, rows: List[Transaction]):
+        rows = sorted(rows, key=lambda r: r.day)
+        self.days = np.fromiter((r.day for r in rows), dtype=np.int64, count=len(rows)) - _EPOCH
+        self.months = self.days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        self.amount = np.fromiter((r.cents for r in rows), dtype=np.int64, count=len(rows)) / 100
+
+        self._category_codes: Dict[str, int] = {}
+        self._subcategory_codes: Dict[str, int] = {}
+        self._seller_codes: Dict[str, int] = {}
+        self.category = _intern([r.category for r in rows], self._category_codes)
+        self.subcategory = _intern([r.subcategory for r in rows], self._subcategory_codes)
+        self.seller = _intern([r.seller for r in rows], self._seller_codes)
+        self.category_names = list(self._category_codes)
+        self.subcategory_names = list(self._subcategory_codes)
+        self.seller_names = list(self._seller_codes)
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    def snapshot(self, start_date: str, end_date: str, top_sellers: int = 5) -> Dict[str, Any]:
+        """
+        Aggregates of the transactions between two YYYY-MM-DD dates (inclusive): income and
+        spending totals, per-category monthly totals with their average and standard deviation,
+        per-subcategory totals, the sellers with the most spending and recurring charges
+        (same seller and amount in at least half of the months, and at least two).
+        """
+        # day_of rather than np.datetime64, which rejects dates like 2024-1-5
+        start, end = day_of(start_date) - _EPOCH, day_of(end_date) - _EPOCH
+        lo = int(np.searchsorted(self.days, start, "left"))
+        hi = int(np.searchsorted(self.days, end, "right"))
+        first = int(np.datetime64(start, "D").astype("datetime64[M]").astype(np.int64))
+        n_months = int(np.datetime64(end, "D").astype("datetime64[M]").astype(np.int64)) - first + 1
+        month_names = [str(np.datetime64(first + i, "M")) for i in range(n_months)]
+
+        amount = self.amount[lo:hi]
+        cats = self.category[lo:hi]
+        subs = self.subcategory[lo:hi]
+        sellers = self.seller[lo:hi]
+        month_offset = self.months[lo:hi] - first
+
+        n_categories = len(self.category_names)
+        sums = np.bincount(
+            month_offset * n_categories + cats, weights=amount, minlength=n_months * n_categories
+        ).reshape(n_months, n_categories)
+
+        # Subcategory totals per (category, subcategory) pair, as one name can be used under
+        # several categories
+        has_sub = subs >= 0
+        n_subcategories = len(self.subcategory_names)
+        pairs, pair_index = np.unique(
+            cats[has_sub].astype(np.int64) * n_subcategories + subs[has_sub], return_inverse=True
+        )
+        pair_totals = np.bincount(pair_index, weights=amount[has_sub], minlength=len(pairs))
+        sub_totals: Dict[int, Dict[str, float]] = {}
+        for pair, total in zip(pairs.tolist(), pair_totals.tolist()):
+            cat, sub = divmod(pair, n_subcategories)
+            sub_totals.setdefault(cat, {})[self.subcategory_names[sub]] = round(total, 2)
+
+        categories: Dict[str, Dict[str, Any]] = {}
+        for code in sorted(set(cats.tolist()), key=lambda c: sums[:, c].sum()):
+            monthly = sums[:, code]
+            categories[self.category_names[code]] = {
+                "total": round(float(monthly.sum()), 2),
+                "monthly_totals": {m: round(float(v), 2) for m, v in zip(month_names, monthly)},
+                "monthly_average": round(float(monthly.mean()), 2),
+                "monthly_std": round(float(monthly.std()), 2),
+                "subcategories": sub_totals.get(code, {}),
+            }
+
+        # Sellers ranked by money spent (negative amounts)
+        spent = (amount < 0) & (sellers >= 0)
+        n_sellers = len(self.seller_names)
+        seller_spend = np.bincount(sellers[spent], weights=amount[spent], minlength=n_sellers)
+        seller_count = np.bincount(sellers[spent], minlength=n_sellers)
+        top = [
+            {"Seller": self.seller_names[s], "total": round(float(seller_spend[s]), 2), "count": int(seller_count[s])}
+            for s in np.argsort(seller_spend, kind="stable")[:top_sellers] if seller_count[s]
+        ]
+
+        # Recurring: the same seller charging the same amount in several different months
+        recurring = []
+        known = sellers >= 0
+        if known.any():
+            cents = np.round(amount[known] * 100).astype(np.int64)
+            distinct = np.unique(np.stack([sellers[known], cents, month_offset[known]], axis=1), axis=0)
+            charges, months_seen = np.unique(distinct[:, :2], axis=0, return_counts=True)
+            min_months = max(2, (n_months + 1) // 2)
+            for (seller, cent), count in zip(charges, months_seen):
+                if count >= min_months:
+                    recurring.append({
+                        "Seller": self.seller_names[int(seller)],
+                        "Amount": int(cent) / 100,
+                        "months": int(count),
+                    })
+            recurring.sort(key=lambda r: r["Amount"])
+
+        income = amount[amount > 0].sum()
+        spending = amount[amount < 0].sum()
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "months": month_names,
+            "transaction_count": int(hi - lo),
+            "total_income": round(float(income), 2),
+            "total_spending": round(float(spending), 2),
+            "net": round(float(income + spending), 2),
+            "categories": categories,
+            "top_sellers": top,
+            "recurring_charges": recurring,
+        }
@@ -0,0 +1,211 @@
+import asyncio
+import csv
+import json
+import math
+import os
+import tempfile
+import time
+from datetime import date
+from functools import lru_cache
+from typing import IO, Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from storage import storage, StorageError
+from tools import collection_reads, transactions_repo
+from transaction_record import Transaction
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Rows written to the storage backend per transaction (and per progress line).
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Invalid rows described in the import report; the rest are only counted.
+IMPORT_MAX_ERRORS = 20
+
+# Columns of an imported transaction; Subcategory may be left empty
+COLUMNS = ("Date", "Category", "Subcategory", "Amount", "Seller")
+# A row is a duplicate of a stored one (or of an earlier row) with the same values of these
+DEDUPE_FIELDS = ("Date", "Amount", "Seller")
+
+
+async def spool(chunks: AsyncIterator[bytes]) -> IO[bytes]:
+    """
+    Copy an upload to a temporary file. The request body has to be read before a streaming
+    response starts: while it streams, the server's disconnect listener consumes the body.
+    """
+    upload = tempfile.TemporaryFile()
+    async for chunk in chunks:
+        upload.write(chunk)
+    upload.seek(0)
+    return upload
+
+
+async def file_chunks(upload: IO[bytes], size: int = 1 << 20) -> AsyncIterator[bytes]:
+    """Read a spooled upload back a chunk at a time, closing (and so deleting) it at the end."""
+    try:
+        while chunk := upload.read(size):
+            yield chunk
+    finally:
+        upload.close()
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """The complete lines of a byte stream, a chunk's worth at a time."""
+    rest = b""
+    async for chunk in chunks:
+        *lines, rest = (rest + chunk).split(b"\n")
+        if lines:
+            yield b"\n".join(lines).decode("utf-8-sig").split("\n")
+    if rest.strip():
+        yield [rest.decode("utf-8-sig")]
+
+
+@lru_cache(maxsize=65536)
+def _is_date(day: str) -> bool:
+    # An upload repeats the same few thousand dates; fromisoformat alone would also take 20240131
+    try:
+        return len(day) == 10 and bool(date.fromisoformat(day))
+    except ValueError:
+        return False
+
+
+def _validate(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """A transaction row from the uploaded fields, or ValueError saying what is wrong."""
+    day = raw.get("Date")
+    if not isinstance(day, str) or not _is_date(day):
+        raise ValueError("Date must be YYYY-MM-DD")
+    try:
+        amount = float(raw.get("Amount"))
+    except (TypeError, ValueError):
+        amount = math.nan
+    if not math.isfinite(amount):
+        raise ValueError("Amount must be a number")
+    category, seller = raw.get("Category"), raw.get("Seller")
+    if not category or not seller:
+        raise ValueError("Category and Seller are required")
+    return {
+        "Date": day,
+        "Category": str(category),
+        "Subcategory": str(raw["Subcategory"]) if raw.get("Subcategory") else None,
+        "Amount": round(amount, 2),
+        "Seller": str(seller),
+    }
+
+
+def _parse_ndjson(lines: List[str]) -> Iterator[Tuple[Optional[Dict], Optional[str]]]:
+    """(row, None) for every valid line and (None, error) for every invalid one."""
+    lines = [line for line in lines if line.strip()]
+    try:
+        # One decode for the whole chunk; a chunk with a broken line is decoded line by line
+        values = json.loads("[" + ",".join(lines) + "]")
+    except ValueError:
+        values = None
+    for i, line in enumerate(lines):
+        try:
+            raw = json.loads(line) if values is None else values[i]
+            if not isinstance(raw, dict):
+                raise ValueError("Line is not a JSON object")
+            row = _validate(raw)
+        except ValueError as e:
+            yield None, str(e)
+            continue
+        yield row, None
+
+
+class _CsvParser:
+    """Rows of a CSV upload with a header line. Quoted fields may span lines and chunks."""
+
+    def __init__(self):
+        self.header: Optional[Dict[str, int]] = None
+        self._pending = ""
+
+    def __call__(self, lines: List[str]) -> Iterator[Tuple[Optional[Dict], Optional[str]]]:
+        records = []
+        for line in lines:
+            record = self._pending + line if self._pending else line
+            # An odd number of quotes means a quoted field continues on the next line
+            if record.count('"') % 2:
+                self._pending = record + "\n"
+                continue
+            self._pending = ""
+            if record.strip():
+                records.append(record)
+
+        for fields in csv.reader(records):
+            if self.header is None:
+                self.header = {name.strip(): i for i, name in enumerate(fields)}
+                missing = [c for c in COLUMNS if c != "Subcategory" and c not in self.header]
+                if missing:
+                    raise ValueError(f"CSV header is missing {', '.join(missing)}")
+                continue
+            raw = {c: fields[i] for c, i in self.header.items() if c in COLUMNS and i < len(fields)}
+            try:
+                row = _validate(raw)
+            except ValueError as e:
+                yield None, str(e)
+                continue
+            yield row, None
+
+
+async def import_transactions(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Import a streamed NDJSON or CSV upload of transactions. Rows are parsed and validated a
+    chunk at a time on a worker thread and written IMPORT_BATCH_SIZE rows per storage
+    transaction. Rows whose (Date, Amount, Seller) is already stored or repeats an earlier
+    row are skipped by the storage backend as it writes each batch, so memory follows the
+    batch size rather than the upload or the stored history. Yields a progress report after
+    every batch and a final report, which the route streams back as NDJSON.
+    """
+    start = time.perf_counter()
+    report = {"status": "progress", "rows": 0, "imported": 0, "duplicates": 0, "invalid": 0}
+    errors: List[Dict[str, Any]] = []
+    batch: List[Dict] = []
+    parse = _parse_ndjson if fmt == "ndjson" else _CsvParser()
+
+    writing: Optional[asyncio.Task] = None
+
+    async def store(rows: List[Dict]):
+        try:
+            saved = await storage.create_many("transactions", rows, unique_on=DEDUPE_FIELDS)
+        finally:
+            collection_reads.invalidate("transactions")
+        report["imported"] += len(saved)
+        report["duplicates"] += len(rows) - len(saved)
+        # Each stored batch goes into the index right away, converted off the event loop
+        if saved and transactions_repo.is_loaded():
+            transactions_repo.apply_records(added=await run_in_threadpool(lambda: [Transaction.from_row(r) for r in saved]))
+
+    try:
+        async for lines in _lines(chunks):
+            for row, error in await run_in_threadpool(lambda: list(parse(lines))):
+                report["rows"] += 1
+                if error is not None:
+                    report["invalid"] += 1
+                    if len(errors) < IMPORT_MAX_ERRORS:
+                        errors.append({"row": report["rows"], "error": error})
+                    continue
+                batch.append(row)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    # Parse the next batch while this one is written; batches are written in
+                    # order, so each one's duplicate check sees the rows of the one before
+                    if writing is not None:
+                        await writing
+                        yield dict(report)
+                    writing, batch = asyncio.ensure_future(store(batch)), []
+        if writing is not None:
+            await writing
+        if batch:
+            await store(batch)
+        yield {**report, "status": "done", "errors": errors, "seconds": round(time.perf_counter() - start, 2)}
+    except (HTTPException, StorageError, ValueError) as e:
+        # Batches already written stay imported; the report says how many
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f"Error importing transactions: {detail}")
+        yield {**report, "status": "error", "detail": detail, "errors": errors}
+    finally:
+        if writing is not None:
+            # A batch handed to the backend is stored either way; wait so the index includes it
+            await asyncio.gather(writing, return_exceptions=True)
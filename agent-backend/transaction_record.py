@@ -0,0 +1,140 @@
+import sys
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+# Fields of the JSON shape that have a slot of their own; anything else goes in `extra`
+_FIELDS = frozenset(("Date", "Category", "Subcategory", "Amount", "Seller", "id"))
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # Categories, subcategories and sellers repeat across rows; keep one copy of each
+    return None if value is None else sys.intern(str(value))
+
+
+@lru_cache(maxsize=None)
+def iso_date(day: int) -> str:
+    """YYYY-MM-DD of a date ordinal. Cached: a multi-year history only has a few thousand days."""
+    return date.fromordinal(day).isoformat()
+
+
+@lru_cache(maxsize=None)
+def month_of(day: int) -> str:
+    """YYYY-MM of a date ordinal."""
+    return iso_date(day)[:7]
+
+
+@lru_cache(maxsize=None)
+def day_of(iso: str) -> int:
+    """
+    Date ordinal of a YYYY-MM-DD string. Like datetime.strptime, also takes months and days
+    without their leading zero (2024-1-5); raises ValueError otherwise. Cached, so rows of
+    the same day share one int.
+    """
+    try:
+        return date.fromisoformat(iso).toordinal()
+    except ValueError:
+        return datetime.strptime(iso, "%Y-%m-%d").toordinal()
+
+
+def iso_day(value: str) -> str:
+    """The zero-padded YYYY-MM-DD form of a date string day_of() takes, as stored and compared."""
+    return iso_date(day_of(value))
+
+
+@lru_cache(maxsize=1 << 16)
+def _cents(amount: Any) -> int:
+    # Amounts repeat (bills, salaries, common prices), so rows of the same amount share one int
+    return round(float(amount) * 100)
+
+
+def month_days(month: str) -> Tuple[int, int]:
+    """First and last date ordinal of a YYYY-MM month."""
+    first = date.fromordinal(day_of(month + "-01"))
+    following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return first.toordinal(), following.toordinal() - 1
+
+
+class Transaction:
+    """
+    A transaction as held in memory: the date as a date ordinal, the amount in integer
+    cents and the category, subcategory and seller as interned strings, in slots instead of
+    a dict per row. Parsed once from the JSON shape by from_row() and converted back by
+    to_row() only where rows leave the process (API responses, tool results). Records
+    compare and hash by content, so identical rows can be matched across reloads.
+    """
+
+    __slots__ = ("id", "day", "cents", "category", "subcategory", "seller", "extra")
+
+    def __init__(
+        self,
+        id: Optional[str],
+        day: int,
+        cents: int,
+        category: str,
+        subcategory: Optional[str],
+        seller: Optional[str],
+        extra: Optional[Tuple[Tuple[str, Any], ...]] = None,
+    ):
+        self.id = id
+        self.day = day
+        self.cents = cents
+        self.category = category
+        self.subcategory = subcategory
+        self.seller = seller
+        # Fields outside the usual shape, kept so to_row() gives back what was stored
+        self.extra = extra
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "Transaction":
+        extra = None
+        if row.keys() - _FIELDS:
+            extra = tuple(sorted((k, v) for k, v in row.items() if k not in _FIELDS))
+        return cls(
+            row.get("id"),
+            day_of(row["Date"]),
+            _cents(row["Amount"]),
+            _intern(row["Category"]),
+            _intern(row.get("Subcategory")),
+            _intern(row.get("Seller")),
+            extra,
+        )
+
+    @property
+    def date(self) -> str:
+        return iso_date(self.day)
+
+    @property
+    def month(self) -> str:
+        return month_of(self.day)
+
+    @property
+    def amount(self) -> float:
+        return self.cents / 100
+
+    def to_row(self) -> Dict[str, Any]:
+        """The JSON shape the storage backends and the API use."""
+        row = {
+            "Date": self.date,
+            "Category": self.category,
+            "Subcategory": self.subcategory,
+            "Amount": self.amount,
+            "Seller": self.seller,
+            "id": self.id,
+        }
+        if self.extra:
+            row.update(self.extra)
+        return row
+
+    def _key(self) -> Tuple:
+        return (self.day, self.cents, self.id, self.category, self.subcategory, self.seller)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Transaction) and self._key() == other._key() and self.extra == other.extra
+
+    def __hash__(self) -> int:
+        # Only the typed fields: extra values may be lists or dicts, which can't be hashed
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return f"Transaction({self.to_row()!r})"
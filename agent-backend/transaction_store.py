@@ -0,0 +1,273 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from transaction_record import Transaction, day_of, month_days
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Seconds a loaded snapshot is served before the collection is checked for changes again.
+TRANSACTIONS_REFRESH_INTERVAL = float(os.getenv("TRANSACTIONS_REFRESH_INTERVAL", "30"))
+
+_day = attrgetter("day")
+
+
+def _group(groups: Dict[Transaction, Any], row: Transaction):
+    """
+    Add row to a {record: equal records} map that holds the record itself while it is the
+    only one of its content, and a list only once there are several: most rows are unique,
+    and a list per row would cost more than the record.
+    """
+    held = groups.setdefault(row, row)
+    if held is row:
+        return
+    if isinstance(held, list):
+        held.append(row)
+    else:
+        groups[row] = [held, row]
+
+
+def _members(held: Any) -> List[Transaction]:
+    """The equal records a _group() map holds under one key."""
+    if held is None:
+        return []
+    return held if isinstance(held, list) else [held]
+
+
+class _DateIndex:
+    """Rows kept sorted by their date ordinal, with a parallel list of keys for bisect."""
+
+    def __init__(self):
+        self.dates: List[int] = []
+        self.rows: List[Transaction] = []
+
+    def insert(self, row: Transaction):
+        i = bisect_right(self.dates, row.day)
+        self.dates.insert(i, row.day)
+        self.rows.insert(i, row)
+
+    def insert_many(self, rows: List[Transaction]):
+        if len(rows) < 64:
+            for row in rows:
+                self.insert(row)
+            return
+        # One merge pass of slice copies instead of an O(n) list insert per row. bisect_right
+        # and a stable sort put new rows after existing rows of the same date.
+        rows = sorted(rows, key=_day)
+        merged_dates: List[int] = []
+        merged_rows: List[Transaction] = []
+        last = 0
+        for row in rows:
+            at = bisect_right(self.dates, row.day, last)
+            merged_dates += self.dates[last:at]
+            merged_rows += self.rows[last:at]
+            merged_dates.append(row.day)
+            merged_rows.append(row)
+            last = at
+        merged_dates += self.dates[last:]
+        merged_rows += self.rows[last:]
+        self.dates, self.rows = merged_dates, merged_rows
+
+    def remove(self, row: Transaction):
+        lo = bisect_left(self.dates, row.day)
+        hi = bisect_right(self.dates, row.day)
+        for i in range(lo, hi):
+            if self.rows[i] is row:
+                del self.dates[i]
+                del self.rows[i]
+                return
+
+    def between(self, start: int, end: int) -> List[Transaction]:
+        return self.rows[bisect_left(self.dates, start):bisect_right(self.dates, end)]
+
+
+class TransactionRepository:
+    """
+    In-process copy of the transactions collection with a date index and a per-category
+    date index. Month and range queries are answered by bisecting instead of scanning.
+    Rows are held as Transaction records, converted once when the collection is loaded.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[List[Dict]]], refresh_interval: float = TRANSACTIONS_REFRESH_INTERVAL):
+        self._loader = loader
+        self.refresh_interval = refresh_interval
+        self._index = _DateIndex()
+        self._by_category: Dict[str, _DateIndex] = {}
+        # json-server ids are short and do collide, so rows are tracked by their full content
+        # (records hash and compare by content), grouped by _group()
+        self._by_key: Dict[Transaction, Any] = {}
+        self._loaded_at: Optional[float] = None
+        # Set by the first load; an empty collection is loaded too, so _by_key can't tell
+        self._loaded = False
+        self._lock: Optional[asyncio.Lock] = None
+        # Bumped on every change so derived views (e.g. columnar arrays) know when to rebuild
+        self.version = 0
+        self._listeners: List[Callable[[Set[str]], None]] = []
+        self._row_listeners: List[Callable[[List[Transaction], List[Transaction]], None]] = []
+
+    def _add_many(self, rows: List[Transaction]):
+        by_category: Dict[str, List[Transaction]] = {}
+        for row in rows:
+            _group(self._by_key, row)
+            by_category.setdefault(row.category, []).append(row)
+        self._index.insert_many(rows)
+        for category, category_rows in by_category.items():
+            self._by_category.setdefault(category, _DateIndex()).insert_many(category_rows)
+
+    def _discard(self, row: Transaction):
+        held = self._by_key.pop(row)
+        if isinstance(held, list):
+            del held[next(i for i, r in enumerate(held) if r is row)]
+            # Re-added under a remaining record, so the key doesn't keep the discarded one alive
+            remaining = held if len(held) > 1 else held[0]
+            self._by_key[_members(remaining)[0]] = remaining
+        self._index.remove(row)
+        self._by_category[row.category].remove(row)
+
+    def _rebuild(self, rows: List[Transaction]):
+        self._index = _DateIndex()
+        self._by_category = {}
+        self._by_key = {}
+        for row in sorted(rows, key=_day):
+            _group(self._by_key, row)
+            self._index.dates.append(row.day)
+            self._index.rows.append(row)
+            category = self._by_category.setdefault(row.category, _DateIndex())
+            category.dates.append(row.day)
+            category.rows.append(row)
+
+    def _apply(self, raw_rows: List[Dict]) -> Tuple[int, int]:
+        """Bring the indexes in line with `raw_rows`, touching only rows that changed."""
+        rows = [Transaction.from_row(row) for row in raw_rows]
+        if not self._loaded:
+            # First load: sorting once beats inserting row by row
+            self._rebuild(rows)
+            self._loaded = True
+            self.version += 1
+            return len(rows), 0
+
+        incoming: Dict[Transaction, Any] = {}
+        for row in rows:
+            _group(incoming, row)
+
+        removed = []
+        for key, held in self._by_key.items():
+            current = _members(held)
+            surplus = len(current) - len(_members(incoming.get(key)))
+            if surplus > 0:
+                removed.extend(current[-surplus:])
+        for row in removed:
+            self._discard(row)
+
+        added = []
+        for key, held in incoming.items():
+            new = _members(held)
+            missing = len(new) - len(_members(self._by_key.get(key)))
+            if missing > 0:
+                added.extend(new[-missing:])
+        self._add_many(added)
+        if added or removed:
+            self._notify(added, removed)
+        return len(added), len(removed)
+
+    def _notify(self, added: List[Transaction], removed: List[Transaction]):
+        self.version += 1
+        changed_months = {row.month for row in added + removed}
+        for listener in self._listeners:
+            listener(changed_months)
+        for listener in self._row_listeners:
+            listener(added, removed)
+
+    def subscribe(self, listener: Callable[[Set[str]], None]):
+        """Call listener with the YYYY-MM months touched whenever rows change after the first load."""
+        self._listeners.append(listener)
+
+    def subscribe_rows(self, listener: Callable[[List[Transaction], List[Transaction]], None]):
+        """Call listener(added, removed) with the rows of every change after the first load."""
+        self._row_listeners.append(listener)
+
+    def apply_write(self, added: List[Dict] = (), removed: List[Dict] = ()):
+        """
+        Apply a write made through the backend right away instead of waiting for the next
+        refresh. Takes rows in their JSON shape; rows in `removed` are matched by content.
+        Before the first load this does nothing, as the load will include the write.
+        """
+        if not self._loaded:
+            return
+        self.apply_records(
+            added=[Transaction.from_row(row) for row in added],
+            removed=[Transaction.from_row(row) for row in removed],
+        )
+
+    def apply_records(self, added: List[Transaction] = (), removed: List[Transaction] = ()):
+        """apply_write for rows already converted to records, e.g. off the event loop."""
+        if not self._loaded:
+            return
+        discarded = []
+        for record in removed:
+            same = _members(self._by_key.get(record))
+            if same:
+                discarded.append(same[-1])
+                self._discard(same[-1])
+        added = list(added)
+        self._add_many(added)
+        if added or discarded:
+            self._notify(added, discarded)
+
+    async def refresh(self):
+        rows = await self._loader()
+        self._apply(rows)
+        self._loaded_at = time.monotonic()
+
+    async def ensure_fresh(self):
+        """Reload the collection if the snapshot is older than refresh_interval."""
+        if self.is_fresh():
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another caller may have refreshed while we waited for the lock
+            if not self.is_fresh():
+                await self.refresh()
+
+    def is_loaded(self) -> bool:
+        """Whether the collection has been loaded, so writes have to be applied to it."""
+        return self._loaded
+
+    def is_fresh(self) -> bool:
+        """Whether the loaded snapshot can be served without checking the collection again."""
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval
+
+    def invalidate(self):
+        """Force the next query to check the collection again, e.g. after a write."""
+        self._loaded_at = None
+
+    def in_range(self, start_date: str, end_date: str, category: Optional[str] = None) -> List[Transaction]:
+        """Transactions between two YYYY-MM-DD dates (inclusive), optionally of one category."""
+        return self._between(day_of(start_date), day_of(end_date), category)
+
+    def in_month(self, month: str, category: Optional[str] = None) -> List[Transaction]:
+        """Transactions of a YYYY-MM month."""
+        return self._between(*month_days(month), category)
+
+    def _between(self, start: int, end: int, category: Optional[str]) -> List[Transaction]:
+        if category is not None:
+            index = self._by_category.get(category)
+            return index.between(start, end) if index else []
+        return self._index.between(start, end)
+
+    def all(self) -> List[Transaction]:
+        """Every transaction, sorted by date."""
+        return list(self._index.rows)
+
+    def categories(self) -> List[str]:
+        return [category for category, index in self._by_category.items() if index.rows]
+
+    def __len__(self) -> int:
+        return len(self._index.rows)
@@ -3,15 +3,18 @@ import { AGENT_API_URL } from './apiVariables';
 
 export interface AgentResponse {
   content: string;
+  session_id?: string;
 }
 
 export const sendGoalAgentPrompt = async (
-  prompt: string
+  prompt: string,
+  sessionId?: string
 ): Promise<AgentResponse> => {
   try {
     console.log('Sending prompt to AI agent:', prompt);
     const response = await axios.post(`${AGENT_API_URL}/goal-agent/prompt`, {
       prompt,
+      session_id: sessionId,
     });
     return response.data as AgentResponse;
   } catch (error) {
@@ -41,3 +44,61 @@ export const generateMonthlySummary = async (
     return { content: "Couldn't get a response from the agent." };
   }
 };
+
+export interface AgentStreamHandlers {
+  onToken?: (text: string) => void; // Partial answer text as the agent writes it
+  onToolStarted?: (tool: string) => void; // Partial text so far was not the final answer
+}
+
+export const streamGoalAgentPrompt = async (
+  prompt: string,
+  sessionId: string | undefined,
+  handlers: AgentStreamHandlers
+): Promise<AgentResponse> => {
+  try {
+    console.log('Streaming prompt to AI agent:', prompt);
+    const response = await fetch(`${AGENT_API_URL}/goal-agent/prompt/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ prompt, session_id: sessionId }),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Failed to stream agent response: ${response.statusText}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const result: AgentResponse = { content: '' };
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Server-sent events are separated by a blank line
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary >= 0) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        const eventName = rawEvent.match(/^event: (.*)$/m)?.[1];
+        const data = JSON.parse(rawEvent.match(/^data: (.*)$/m)?.[1] ?? '{}');
+        if (eventName === 'session') {
+          result.session_id = data.session_id;
+        } else if (eventName === 'token') {
+          handlers.onToken?.(data.text);
+        } else if (eventName === 'tool_started') {
+          handlers.onToolStarted?.(data.tool);
+        } else if (eventName === 'answer') {
+          result.content = data.content;
+        }
+      }
+    }
+    return result;
+  } catch (error) {
+    console.error('Error fetching AI response:', error);
+    return { content: "Couldn't get a response from the agent." };
+  }
+};
@@ -1,5 +1,9 @@
 import { useState } from 'react';
-import { sendGoalAgentPrompt, type AgentResponse } from '../../api/endpoints';
+import {
+  sendGoalAgentPrompt,
+  streamGoalAgentPrompt,
+  type AgentResponse,
+} from '../../api/endpoints';
 import { ChatProvider, useChatContext } from './ChatContext';
 import ChatFloatingButton from './ChatFloatingButton';
 import arrow_up from '../../assets/arrow_up.svg';
@@ -12,14 +16,20 @@ const ChatComponent = () => {
   // Refetch the data after agent responses. TODO: Figure out a way to only do it when the agent has used a tool that modifies data.
   const { goalsResponse } = useDataContext();
 
-  const { messageHistory, addMessage } = useChatContext();
+  const { messageHistory, addMessage, sessionId, setSessionId } =
+    useChatContext();
 
   const [prompt, setPrompt] = useState(''); // State to hold the input value
   const [chatOpen, setChatOpen] = useState(false); // State to control chat visibility
   const [responseLoading, setResponseLoading] = useState(false);
+  const [streamingContent, setStreamingContent] = useState(''); // Partial answer while the agent is writing
 
   const handleAgentResponse = (agentResponse: AgentResponse) => {
     setResponseLoading(false);
+    setStreamingContent('');
+    if (agentResponse.session_id) {
+      setSessionId(agentResponse.session_id); // Keep the conversation going in the same session
+    }
     addMessage({ role: 'agent', content: agentResponse.content });
     goalsResponse.refetch(); // Refetch the goals data after receiving the agent's response
   };
@@ -36,7 +46,10 @@ const ChatComponent = () => {
     setResponseLoading(true);
 
     try {
-      const agentResponse = await sendGoalAgentPrompt(prompt);
+      const agentResponse = await streamGoalAgentPrompt(prompt, sessionId, {
+        onToken: (text) => setStreamingContent((prev) => prev + text),
+        onToolStarted: () => setStreamingContent(''), // The text so far led to a tool call
+      });
       handleAgentResponse(agentResponse); // Update the response state with the agent's response
     } catch (error) {
       setResponseLoading(false);
@@ -46,7 +59,7 @@ const ChatComponent = () => {
 
   const getWelcomeMessage = async () => {
     try {
-      const agentResponse = await sendGoalAgentPrompt('/start');
+      const agentResponse = await sendGoalAgentPrompt('/start', sessionId);
       handleAgentResponse(agentResponse); // Update the response state with the agent's response
     } catch (error) {
       setResponseLoading(false);
@@ -100,9 +113,16 @@ const ChatComponent = () => {
                   </div>
                 ))}
 
-                {responseLoading && (
-                  <div>I&apos;m thinking, hold on tight...</div>
-                )}
+                {responseLoading &&
+                  (streamingContent ? (
+                    <div className="chat-item-container">
+                      <div className="chat-item agent">
+                        <Markdown children={streamingContent} />
+                      </div>
+                    </div>
+                  ) : (
+                    <div>I&apos;m thinking, hold on tight...</div>
+                  ))}
               </div>
               <div className="chat-input-container">
                 <input
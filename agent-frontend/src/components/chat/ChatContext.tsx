@@ -11,6 +11,8 @@ interface ChatContextType {
   messageHistory: Message[];
   addMessage: (message: Message) => void;
   clearHistory: () => void;
+  sessionId?: string;
+  setSessionId: (sessionId: string) => void;
 }
 
 // Create the context
@@ -19,6 +21,7 @@ const ChatContext = createContext<ChatContextType | undefined>(undefined);
 // Provider component
 export const ChatProvider = ({ children }: { children: React.ReactNode }) => {
   const [messageHistory, setMessageHistory] = useState<Message[]>([]);
+  const [sessionId, setSessionId] = useState<string | undefined>(); // Backend conversation session
 
   // Function to add a message to the history
   const addMessage = (message: Message) => {
@@ -31,7 +34,9 @@ export const ChatProvider = ({ children }: { children: React.ReactNode }) => {
   };
 
   return (
-    <ChatContext.Provider value={{ messageHistory, addMessage, clearHistory }}>
+    <ChatContext.Provider
+      value={{ messageHistory, addMessage, clearHistory, sessionId, setSessionId }}
+    >
       {children}
     </ChatContext.Provider>
   );